@@ -1,12 +1,145 @@
 from http.server import BaseHTTPRequestHandler
+import http.client
 import json
+import os
+import tempfile
+import time
+import urllib.parse
+import uuid
+
+# This relay runs on the serverless platform and must stay import-light (no
+# Flask, PIL or zeroconf) so cold starts are fast. It streams uploads to a spool
+# file and forwards them to the on-premises printit server.
+SPOOL_URL = os.environ.get('PRINTIT_SPOOL_URL', '')  # e.g. https://printer.example.com
+RELAY_MAX_BYTES = int(os.environ.get('PRINTIT_RELAY_MAX_BYTES', 50 * 1024 * 1024))
+RELAY_CHUNK_SIZE = 64 * 1024
+# Everything one invocation does (forwarding, retries, draining the buffer) has to fit
+# well inside the platform's function time limit, or the function is killed before it
+# can buffer the upload
+RELAY_TIME_BUDGET = float(os.environ.get('PRINTIT_RELAY_TIME_BUDGET', 25))  # seconds
+RELAY_CONNECT_TIMEOUT = 3  # a blackholed spool server should fail fast
+RELAY_BUFFER_RESERVE = 2  # budget kept back for buffering the upload when forwarding fails
+RELAY_DRAIN_MIN_TIME = 5  # only retry buffered uploads if this much budget is left
+RELAY_RETRIES = 3
+RELAY_RETRY_DELAY = 0.5  # doubled after every failed attempt
+RELAY_PATHS = ('/upload', '/print_direct')
+
+# Jobs the spool server could not take are kept here and retried on later
+# requests. Serverless /tmp only lives as long as the instance, so this is a
+# best-effort buffer for short outages.
+BUFFER_DIR = os.path.join(tempfile.gettempdir(), 'printit_relay_buffer')
+BUFFER_MAX_BYTES = 200 * 1024 * 1024
+BUFFER_DRAIN_BATCH = 3
+
+def forward_upload(body_path, path, headers, deadline):
+    """POST a spooled multipart body to the spool server before deadline; returns (status, body)"""
+    url = urllib.parse.urlsplit(SPOOL_URL)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    remaining = deadline - time.monotonic()
+    conn = connection_class(url.netloc, timeout=max(0.1, min(RELAY_CONNECT_TIMEOUT, remaining)))
+    try:
+        conn.connect()
+        # The spool server only answers once the job is submitted, so wait as long as the budget allows
+        conn.sock.settimeout(max(0.1, deadline - time.monotonic()))
+        conn.putrequest('POST', url.path.rstrip('/') + path)
+        for name, value in headers.items():
+            conn.putheader(name, value)
+        conn.putheader('Content-Length', str(os.path.getsize(body_path)))
+        conn.endheaders()
+        with open(body_path, 'rb') as body:
+            for chunk in iter(lambda: body.read(RELAY_CHUNK_SIZE), b''):
+                conn.send(chunk)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+def forward_with_retries(body_path, path, headers, deadline):
+    """Forward an upload, retrying connection errors and 5xx replies until deadline
+
+    Returns (status, body) or (None, error). A retry after a timed-out response is safe
+    because the spool server drops repeats of the same Idempotency-Key.
+    """
+    delay = RELAY_RETRY_DELAY
+    error = 'no time left to contact the spool server'
+    for attempt in range(RELAY_RETRIES):
+        if deadline - time.monotonic() <= 0:
+            break
+        try:
+            status, body = forward_upload(body_path, path, headers, deadline)
+            if status < 500:
+                return status, body
+            error = f"spool server returned {status}"
+        except (OSError, http.client.HTTPException) as e:
+            error = str(e) or type(e).__name__
+        if attempt < RELAY_RETRIES - 1:
+            if time.monotonic() + delay + RELAY_CONNECT_TIMEOUT > deadline:
+                break
+            time.sleep(delay)
+            delay *= 2
+    return None, error
+
+def buffer_size():
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(BUFFER_DIR))
+    except OSError:
+        return 0
+
+def buffer_upload(body_path, path, headers):
+    """Keep an upload for a later retry; returns False if the buffer is full"""
+    os.makedirs(BUFFER_DIR, exist_ok=True)
+    if buffer_size() + os.path.getsize(body_path) > BUFFER_MAX_BYTES:
+        return False
+    job_id = f"{time.time():.6f}-{uuid.uuid4().hex[:8]}"
+    os.replace(body_path, os.path.join(BUFFER_DIR, job_id + '.body'))
+    # The metadata file is written last; its presence marks the job as complete
+    with open(os.path.join(BUFFER_DIR, job_id + '.json'), 'w') as f:
+        json.dump({'path': path, 'headers': headers}, f)
+    return True
+
+def drain_buffer(deadline):
+    """Retry a few buffered uploads, oldest first, stopping at deadline"""
+    try:
+        names = sorted(name for name in os.listdir(BUFFER_DIR) if name.endswith('.json'))
+    except OSError:
+        return
+    for name in names[:BUFFER_DRAIN_BATCH]:
+        if deadline - time.monotonic() < RELAY_DRAIN_MIN_TIME:
+            return
+        meta_path = os.path.join(BUFFER_DIR, name)
+        claimed_path = meta_path + '.sending'
+        try:
+            # Claim the job so a concurrent request does not send it twice
+            os.rename(meta_path, claimed_path)
+        except OSError:
+            continue
+        body_path = meta_path[:-len('.json')] + '.body'
+        with open(claimed_path) as f:
+            meta = json.load(f)
+        status, _ = forward_with_retries(body_path, meta['path'], meta['headers'], deadline)
+        if status is None:
+            # Still unreachable; put it back and stop trying for now
+            os.rename(claimed_path, meta_path)
+            return
+        os.remove(body_path)
+        os.remove(claimed_path)
 
 class Handler(BaseHTTPRequestHandler):
+    def send_json(self, status, payload, headers=None):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_GET(self):
         self.send_response(200)
         self.send_header('Content-type', 'text/html')
         self.end_headers()
-        
+
         # Simple HTML response
         html = """
         <!DOCTYPE html>
@@ -18,6 +151,7 @@ class Handler(BaseHTTPRequestHandler):
                 .container { max-width: 800px; margin: 0 auto; }
                 h1 { color: #333; }
                 .note { background-color: #f8f9fa; padding: 15px; border-left: 4px solid #4CAF50; }
+                button { padding: 10px; background-color: #4CAF50; color: white; border: none; cursor: pointer; border-radius: 4px; }
             </style>
         </head>
         <body>
@@ -25,9 +159,14 @@ class Handler(BaseHTTPRequestHandler):
                 <h1>WifiPrinter Web Service</h1>
                 <div class="note">
                     <p>This is a web service that enables printing to network printers.</p>
-                    <p>Note: The full web interface is not available on this serverless platform.</p>
-                    <p>For the complete interface with printing capabilities, please use the local deployment.</p>
+                    <p>Documents uploaded here are relayed to the print server. If it is
+                    temporarily unreachable, they are held and sent once it is back.</p>
+                    <p>For the complete interface, please use the local deployment.</p>
                 </div>
+                <form action="/print_direct" method="post" enctype="multipart/form-data">
+                    <p><input type="file" name="file" required></p>
+                    <button type="submit">Print Document</button>
+                </form>
             </div>
         </body>
         </html>
@@ -35,4 +174,63 @@ class Handler(BaseHTTPRequestHandler):
         self.wfile.write(html.encode())
         return
 
-handler = Handler
\ No newline at end of file
+    def do_POST(self):
+        deadline = time.monotonic() + RELAY_TIME_BUDGET
+        path = urllib.parse.urlsplit(self.path).path
+        if path not in RELAY_PATHS:
+            return self.send_json(404, {'success': False, 'message': f"Unknown endpoint: {path}"})
+        if not SPOOL_URL:
+            return self.send_json(503, {'success': False, 'message': 'Relay is not configured (PRINTIT_SPOOL_URL)'})
+
+        content_type = self.headers.get('Content-Type', '')
+        boundary = content_type.partition('boundary=')[2].split(';')[0].strip().strip('"')
+        if not content_type.startswith('multipart/form-data') or not boundary:
+            return self.send_json(400, {'success': False, 'message': 'Expected a multipart/form-data upload'})
+
+        length = self.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            return self.send_json(411, {'success': False, 'message': 'Content-Length is required'})
+        length = int(length)
+        if length > RELAY_MAX_BYTES:
+            return self.send_json(413, {'success': False,
+                                        'message': f"File is too large (limit {RELAY_MAX_BYTES // (1024 * 1024)} MB)"})
+
+        # Stream the body to disk so it can be replayed on retry without holding it in memory
+        fd, body_path = tempfile.mkstemp(prefix='relay_', suffix='.body')
+        try:
+            with os.fdopen(fd, 'wb') as spool:
+                remaining = length
+                first_chunk = True
+                while remaining:
+                    chunk = self.rfile.read(min(RELAY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    if first_chunk and not chunk.startswith(b'--' + boundary.encode()):
+                        return self.send_json(400, {'success': False, 'message': 'Malformed multipart body'})
+                    first_chunk = False
+                    spool.write(chunk)
+                    remaining -= len(chunk)
+            if remaining:
+                return self.send_json(400, {'success': False, 'message': 'Upload was truncated'})
+
+            # The spool server uses the idempotency key to avoid printing a retried upload twice
+            headers = {
+                'Content-Type': content_type,
+                'Idempotency-Key': self.headers.get('Idempotency-Key') or uuid.uuid4().hex,
+                'X-Request-ID': self.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+            }
+            status, body = forward_with_retries(body_path, path, headers, deadline - RELAY_BUFFER_RESERVE)
+            if status is not None:
+                self.send_json(status, body, {'X-Request-ID': headers['X-Request-ID']})
+                # The spool server is reachable again, so retry anything buffered earlier
+                drain_buffer(deadline)
+            elif buffer_upload(body_path, path, headers):
+                self.send_json(202, {'success': True, 'queued': True,
+                                     'message': f"Print server unreachable ({body}); job queued for retry"})
+            else:
+                self.send_json(503, {'success': False, 'message': f"Print server unreachable ({body}) and relay buffer is full"})
+        finally:
+            if os.path.exists(body_path):
+                os.remove(body_path)
+
+handler = Handler
@@ -0,0 +1,93 @@
+"""Measure peak memory of image to PDF conversion
+
+Each conversion runs in a fresh process so its peak RSS is not inflated by the
+previous one. "strips" is convert_to_pdf_if_needed; "pillow" is the whole-image
+Image.save(..., 'PDF') conversion it replaced. Linux and macOS only.
+
+    python benchmarks/convert_memory.py --sizes 4000x3000 8000x6000 16000x12000
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+
+def make_images(directory, width, height):
+    """Write a JPEG, an uncompressed TIFF and a PNG with an alpha channel, with detail that compresses realistically"""
+    from PIL import Image, ImageDraw
+    Image.MAX_IMAGE_PIXELS = None
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for x in range(0, width, 97):
+        draw.line((x, 0, width - x, height), fill=(x % 255, 100, 200), width=5)
+    jpeg_path = os.path.join(directory, f"image_{width}x{height}.jpg")
+    image.save(jpeg_path, quality=85)
+    tiff_path = os.path.join(directory, f"image_{width}x{height}.tiff")
+    image.save(tiff_path)
+    image.putalpha(128)
+    png_path = os.path.join(directory, f"image_{width}x{height}.png")
+    image.save(png_path, compress_level=1)
+    return [jpeg_path, tiff_path, png_path]
+
+
+def convert(method, path):
+    """Convert one image in this process and print the peak RSS in MB"""
+    from PIL import Image
+    import printit
+    if method == 'strips':
+        if not printit.convert_to_pdf_if_needed(path).endswith('.pdf'):
+            print('rejected')
+            return
+    else:
+        Image.MAX_IMAGE_PIXELS = None
+        image = Image.open(path)
+        if image.mode in ('RGBA', 'LA'):
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image.save(os.path.splitext(path)[0] + '.pdf', 'PDF', resolution=100.0)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    print(peak // (1024 * 1024) if sys.platform == 'darwin' else peak // 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['4000x3000', '8000x6000'])
+    parser.add_argument('--convert', nargs=2, metavar=('METHOD', 'PATH'), help=argparse.SUPPRESS)
+    parser.add_argument('--make', nargs=3, metavar=('DIRECTORY', 'WIDTH', 'HEIGHT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.convert:
+        convert(*args.convert)
+        return
+    if args.make:
+        print('\n'.join(make_images(args.make[0], int(args.make[1]), int(args.make[2]))))
+        return
+
+    directory = tempfile.mkdtemp()
+    try:
+        for size in args.sizes:
+            # Everything runs in child processes, as Linux carries the peak RSS over a fork and exec
+            made = subprocess.run([sys.executable, __file__, '--make', directory] + size.split('x'),
+                                  capture_output=True, text=True, check=True)
+            for path in made.stdout.split():
+                results = []
+                for method in ('pillow', 'strips'):
+                    output = subprocess.run([sys.executable, __file__, '--convert', method, path],
+                                            capture_output=True, text=True, cwd=directory)
+                    lines = output.stdout.split()
+                    result = lines[-1] if output.returncode == 0 and lines else 'failed'
+                    results.append(f"{method} {result}{' MB' if result.isdigit() else ''}")
+                print(f"{os.path.basename(path):>24}: {', '.join(results)}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Measure end-to-end latency of /print_direct with a slow printer and a throttled upload
+
+The printer is stubbed: the reachability probe and the capability fetch each take
+--printer-latency seconds (cold profile cache on every request, as after PROFILE_TTL),
+and submission takes 50 ms. A 4000x3000 JPEG is uploaded over a real socket in 256 KB
+steps, throttled to each --rate in MB/s (0 = unthrottled). Point --repo at another
+checkout, e.g. a git worktree of an earlier commit, to compare against it.
+
+    python benchmarks/pipeline_latency.py --rate 0 20 --runs 6
+"""
+import argparse
+import http.client
+import io
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_printit(repo, printer_latency):
+    """Import printit from repo with its printer I/O replaced by stubs"""
+    sys.path.insert(0, repo)
+    # printit logs to printit.log in the working directory
+    os.chdir(tempfile.mkdtemp())
+    import printit
+    logging.disable(logging.INFO)
+    printit.JOBS_DB = os.path.join(os.getcwd(), 'jobs.sqlite3')
+    printit.DEDUP_DB = os.path.join(os.getcwd(), 'dedup.sqlite3')
+
+    def slow_probe(printer_info, port=None):
+        time.sleep(printer_latency)
+        return True, "Connection successful"
+
+    def slow_profile(printer_info):
+        time.sleep(printer_latency)
+        return {'formats': ['application/pdf'], 'resolutions': [300], 'default_dpi': 300,
+                'media': [], 'media_default': None, 'duplex': False}
+
+    def fake_send(printer_info, document_path, timeout):
+        time.sleep(0.05)
+        return True, 'sent'
+
+    printit.test_printer_connection = slow_probe
+    printit.fetch_printer_profile = slow_profile
+    printit.PLATFORM_TRANSPORTS['Linux'] = [('true', fake_send)]
+    return printit
+
+
+def upload(port, data, name, rate):
+    """POST data as a multipart upload, sending at most rate MB/s; returns the response body"""
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        conn.putrequest('POST', '/print_direct')
+        conn.putheader('Content-Type', f'multipart/form-data; boundary={boundary}')
+        conn.putheader('Content-Length', str(len(body)))
+        conn.endheaders()
+        step = 256 * 1024
+        for offset in range(0, len(body), step):
+            conn.send(body[offset:offset + step])
+            if rate:
+                time.sleep(step / (rate * 1e6))
+        return conn.getresponse().read()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, nargs='+', default=[0, 20], help='upload MB/s; 0 is unthrottled')
+    parser.add_argument('--runs', type=int, default=6)
+    parser.add_argument('--printer-latency', type=float, default=0.3)
+    parser.add_argument('--repo', default=REPO, help='checkout to benchmark')
+    args = parser.parse_args()
+
+    printit = load_printit(os.path.abspath(args.repo), args.printer_latency)
+    from PIL import Image
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, printit.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    photo = io.BytesIO()
+    Image.merge('RGB', [Image.effect_noise((4000, 3000), 40)] * 3).save(photo, 'JPEG', quality=90)
+    data = photo.getvalue()
+    for rate in args.rate:
+        timings = []
+        for run in range(args.runs):
+            printit.PRINTER_PROFILES.clear()
+            started = time.monotonic()
+            # A different trailing byte each time keeps the duplicate check from short-cutting the job
+            reply = upload(server.server_port, data + os.urandom(8), f"photo{run}.jpg", rate)
+            timings.append(time.monotonic() - started)
+            if b'"success": true' not in reply and b'"success":true' not in reply:
+                print(f"request failed: {reply[:200]!r}")
+                return
+        print(f"{len(data) / 1e6:.1f} MB JPEG, upload {rate or 'unthrottled'} MB/s: "
+              f"median {statistics.median(timings) * 1000:.0f} ms, min {min(timings) * 1000:.0f} ms")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
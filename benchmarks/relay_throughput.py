@@ -0,0 +1,107 @@
+"""Measure the upload relay's cold-start import time and its forwarding throughput
+
+Cold start imports api/index.py in fresh interpreters, timing the import after the
+runtime's own http.server import, as on the serverless platform. Throughput posts a
+multipart upload through a local relay to a stand-in spool server that discards it.
+
+    python benchmarks/relay_throughput.py --size-mb 40 --runs 5
+"""
+import argparse
+import http.client
+import http.server
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+RELAY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api', 'index.py')
+BOUNDARY = 'relaybenchmark'
+
+IMPORT_TIMER = f"""
+import http.server, importlib.util, time
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('relay', {RELAY_PATH!r})
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+print(time.perf_counter() - started)
+"""
+
+
+class DiscardingSpoolHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        remaining = int(self.headers['Content-Length'])
+        while remaining:
+            remaining -= len(self.rfile.read(min(1024 * 1024, remaining)))
+        reply = b'{"success": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(handler):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure_cold_start(runs):
+    imports = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_TIMER], capture_output=True, text=True, check=True)
+        imports.append(float(output.stdout))
+    print(f"cold start: import {statistics.median(imports) * 1000:.1f} ms median over {runs} runs")
+
+
+def measure_throughput(size_mb, runs):
+    spec = importlib.util.spec_from_file_location('relay', RELAY_PATH)
+    relay = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(relay)
+
+    class QuietRelayHandler(relay.Handler):
+        def log_message(self, *args):
+            pass
+
+    spool = start_server(DiscardingSpoolHandler)
+    relay.SPOOL_URL = f"http://127.0.0.1:{spool.server_port}"
+    relay.RELAY_MAX_BYTES = (size_mb + 1) * 1024 * 1024
+    server = start_server(QuietRelayHandler)
+
+    body = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"benchmark.pdf\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n").encode()
+    body += os.urandom(size_mb * 1024 * 1024) + f"\r\n--{BOUNDARY}--\r\n".encode()
+    timings = []
+    for _ in range(runs):
+        conn = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=60)
+        started = time.perf_counter()
+        conn.request('POST', '/print_direct', body, {'Content-Type': f"multipart/form-data; boundary={BOUNDARY}"})
+        response = conn.getresponse()
+        response.read()
+        timings.append(time.perf_counter() - started)
+        conn.close()
+        if response.status != 200:
+            print(f"throughput: relay returned {response.status}")
+            return
+    best = min(timings)
+    print(f"throughput: {size_mb} MB relayed in {best * 1000:.0f} ms, {size_mb / best:.0f} MB/s (best of {runs})")
+    server.shutdown()
+    spool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=40)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    measure_cold_start(args.runs)
+    measure_throughput(args.size_mb, args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Compare submission throughput of the raw, LPD and lp transports
+
+Raw and LPD documents go to local sinks that discard what they receive, so the
+numbers show the client-side cost of each transport. lp is only measured when
+--lp-queue names an existing CUPS queue, ideally one whose backend discards
+jobs (e.g. lpadmin -p null -v file:/dev/null -E).
+
+    python benchmarks/transport_throughput.py --size-mb 64 --runs 5 --lp-queue null
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import printit
+
+
+def discard(conn):
+    while conn.recv(1024 * 1024):
+        pass
+
+
+def lpd_discard(conn):
+    """Acknowledge an RFC 1179 job and its subcommands, discarding the files"""
+    reader = conn.makefile('rb')
+    if not reader.readline():
+        return
+    conn.sendall(b'\0')
+    while True:
+        command = reader.readline()
+        if not command:
+            break
+        conn.sendall(b'\0')
+        # The file follows, then a zero byte
+        remaining = int(command[1:].split(b' ')[0]) + 1
+        while remaining:
+            chunk = reader.read(min(1024 * 1024, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+        conn.sendall(b'\0')
+
+
+def sink(listener, handler):
+    while True:
+        conn, _ = listener.accept()
+        with conn:
+            handler(conn)
+
+
+def start_sink(handler):
+    listener = socket.create_server(('127.0.0.1', 0))
+    threading.Thread(target=sink, args=(listener, handler), daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def send_with_lp(queue, document_path):
+    result = subprocess.run(['lp', '-d', queue, document_path], capture_output=True, text=True)
+    return result.returncode == 0, result.stderr.strip()
+
+
+def measure(name, send, document_path, runs):
+    size_mb = os.path.getsize(document_path) / (1024 * 1024)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        success, message = send(document_path)
+        timings.append(time.perf_counter() - started)
+        if not success:
+            print(f"{name:>4}: failed: {message}")
+            return
+    best = min(timings)
+    print(f"{name:>4}: best {best * 1000:8.1f} ms, {size_mb / best:8.1f} MB/s over {runs} runs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--lp-queue', help='CUPS queue to compare lp against')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        document_path = os.path.join(directory, 'benchmark.pdf')
+        with open(document_path, 'wb') as f:
+            f.write(b'%PDF-1.4\n' + os.urandom(args.size_mb * 1024 * 1024))
+
+        printer = {'name': 'benchmark', 'ip': '127.0.0.1', 'port': 631,
+                   'raw_port': start_sink(discard), 'lpd_port': start_sink(lpd_discard)}
+        measure('raw', lambda path: printit.print_raw_socket(printer, path), document_path, args.runs)
+        measure('lpd', lambda path: printit.print_lpd(printer, path), document_path, args.runs)
+        if args.lp_queue and shutil.which('lp'):
+            measure('lp', lambda path: send_with_lp(args.lp_queue, path), document_path, args.runs)
+        else:
+            print('  lp: skipped (needs lp and --lp-queue)')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
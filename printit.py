@@ -5,23 +5,52 @@ import socket
 import sys
 import logging
 import time
-import shlex
 from zeroconf import ServiceBrowser, Zeroconf
 import tempfile
-from PIL import Image, UnidentifiedImageError
+from PIL import Image, JpegImagePlugin, TiffImagePlugin, UnidentifiedImageError
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject, IndirectObject, NameObject, NumberObject, StreamObject
 import shutil
 import mimetypes
-from flask import Flask, request, render_template, jsonify, redirect, url_for
+from flask import Flask, request, render_template, jsonify, redirect, url_for, g
 import uuid
+import ctypes
+import ctypes.util
+import struct
+import threading
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import itertools
+import getpass
+import io
+import math
+import contextvars
+import sqlite3
+import http.client
+import re
+import signal
+import hmac
+import secrets
+import zlib
+import tracing
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 # Setup logging
+log_handlers = [
+    logging.FileHandler("printit.log"),
+    logging.StreamHandler(sys.stdout)
+]
+for log_handler in log_handlers:
+    log_handler.addFilter(tracing.TraceIdFilter())
 logging.basicConfig(
     level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("printit.log"),
-        logging.StreamHandler(sys.stdout)
-    ]
+    format='%(asctime)s - [%(trace_id)s] %(name)s - %(levelname)s - %(message)s',
+    handlers=log_handlers
 )
 logger = logging.getLogger(__name__)
 
@@ -49,9 +78,14 @@ STATIC_PRINTER = {
     'name': "RICOH_MP_C3003__002673B8A832_",
     'ip': "127.0.0.1",                        # Changed to localhost
     'port': 631,                              # Changed to standard CUPS port
-    'properties': {}
+    'properties': {},
+    'transport': 'cups'                       # 'cups', 'raw' (JetDirect 9100) or 'lpd' (515)
 }
 
+# The web UI downscales photos to the printer's resolution (letter page) before upload;
+# this is used when the printer does not report one
+CLIENT_IMAGE_DEFAULT_DPI = 300
+
 # Modify discover_airprint_printers() to remove local discovery 
 def discover_airprint_printers():
     """Return the static printer configuration only"""
@@ -64,7 +98,396 @@ def get_file_type(file_path):
     logger.debug(f"File {file_path} has mime type: {mime_type}")
     return mime_type
 
-def convert_to_pdf_if_needed(file_path):
+# Document inspection cache, shared by all workers through the filesystem
+INSPECT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'printit_inspect_cache')
+INSPECT_CACHE_MAX_ENTRIES = 1000
+
+def file_content_hash(file_path):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_and_hash(stream, file_path):
+    """Write an upload stream to file_path and return its SHA-256, so it need not be read back"""
+    digest = hashlib.sha256()
+    with open(file_path, 'wb') as f:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def inspect_pdf(file_path):
+    """Read PDF metadata from the xref and page tree without parsing page content"""
+    info = {'detected_type': 'pdf', 'mime_type': 'application/pdf', 'encrypted': False,
+            'page_count': None, 'page_sizes': [], 'printable': True, 'reason': None}
+    try:
+        reader = PdfReader(file_path, strict=False)
+        if reader.is_encrypted:
+            info['encrypted'] = True
+            # Many "encrypted" PDFs only restrict editing and open with an empty password
+            try:
+                opened = reader.decrypt('')
+            except Exception as e:
+                logger.debug(f"Could not decrypt {file_path}: {e}")
+                opened = False
+            if not opened:
+                info['printable'] = False
+                info['reason'] = 'PDF is password protected'
+                return info
+        
+        sizes = {}
+        for page in reader.pages:
+            size = (round(float(page.mediabox.width), 1), round(float(page.mediabox.height), 1))
+            sizes[size] = sizes.get(size, 0) + 1
+        info['page_count'] = sum(sizes.values())
+        info['page_sizes'] = [{'width': w, 'height': h, 'pages': count} for (w, h), count in sizes.items()]
+        if info['page_count'] == 0:
+            info['printable'] = False
+            info['reason'] = 'PDF has no pages'
+    except Exception as e:
+        logger.warning(f"Could not read PDF {file_path}: {e}")
+        info['printable'] = False
+        info['reason'] = f"Could not read PDF: {str(e)}"
+    return info
+
+def inspect_image(file_path):
+    """Read image metadata from the file header without decoding pixel data"""
+    with open_image(file_path) as image:
+        frames = getattr(image, 'n_frames', 1)
+        dpi = image.info.get('dpi')
+        return {
+            'detected_type': 'image',
+            'mime_type': Image.MIME.get(image.format, get_file_type(file_path)),
+            'encrypted': False,
+            'page_count': frames,
+            'page_sizes': [],
+            'image': {
+                'format': image.format,
+                'mode': image.mode,
+                'width': image.width,
+                'height': image.height,
+                'frames': frames,
+                'dpi': [float(v) for v in dpi] if dpi else None
+            },
+            'printable': True,
+            'reason': None
+        }
+
+def read_inspect_cache(content_hash):
+    """Return cached inspection results for a content hash, or None"""
+    try:
+        with open(os.path.join(INSPECT_CACHE_DIR, content_hash + '.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def prune_cache(cache_dir, max_entries, extra_suffixes=()):
+    """Remove the oldest .json entries (and their companion files) beyond max_entries"""
+    entries = [e for e in os.scandir(cache_dir) if e.name.endswith('.json')]
+    if len(entries) > max_entries:
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - max_entries]:
+            for path in [entry.path] + [entry.path[:-len('.json')] + suffix for suffix in extra_suffixes]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+def write_inspect_cache(content_hash, info):
+    """Store inspection results, evicting the oldest entries when the cache is full"""
+    try:
+        os.makedirs(INSPECT_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=INSPECT_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmp_path, os.path.join(INSPECT_CACHE_DIR, content_hash + '.json'))
+        prune_cache(INSPECT_CACHE_DIR, INSPECT_CACHE_MAX_ENTRIES)
+    except OSError as e:
+        logger.warning(f"Could not write inspection cache: {e}")
+
+@tracing.traced('inspect')
+def inspect_document(file_path, content_hash=None):
+    """Return type, page count, page sizes and encryption status for a document"""
+    if content_hash is None:
+        content_hash = file_content_hash(file_path)
+    
+    info = read_inspect_cache(content_hash)
+    if info is not None:
+        logger.debug(f"Inspection cache hit for {content_hash[:12]}")
+        return info
+    
+    with open(file_path, 'rb') as f:
+        header = f.read(1024)
+    
+    if b'%PDF-' in header:
+        info = inspect_pdf(file_path)
+    else:
+        try:
+            info = inspect_image(file_path)
+        except UnidentifiedImageError:
+            mime_type = get_file_type(file_path)
+            info = {
+                'detected_type': 'text' if mime_type and mime_type.startswith('text/') else 'other',
+                'mime_type': mime_type,
+                'encrypted': False,
+                'page_count': None,
+                'page_sizes': [],
+                'printable': bool(header),
+                'reason': None if header else 'File is empty'
+            }
+        except Exception as e:
+            logger.warning(f"Could not read image {file_path}: {e}")
+            info = {'detected_type': 'image', 'mime_type': get_file_type(file_path), 'encrypted': False,
+                    'page_count': None, 'page_sizes': [], 'printable': False,
+                    'reason': f"Could not read image: {str(e)}"}
+    
+    info['content_hash'] = content_hash
+    info['file_size'] = os.path.getsize(file_path)
+    write_inspect_cache(content_hash, info)
+    return info
+
+# Image to PDF conversion
+CONVERT_STRIP_PIXELS = 4 * 1024 * 1024  # pixels decoded into a strip and encoded at a time
+CONVERT_MAX_PIXELS = 2550 * 3300  # larger JPEGs are decoded at reduced scale (letter at 300 dpi)
+CONVERT_PAGE_INCHES = (8.5, 11)  # media used when the printer reports none; images without a DPI are fitted to it
+MEDIA_SIZE = re.compile(r'_(\d+(?:\.\d+)?)x(\d+(?:\.\d+)?)(in|mm)$')  # PWG 5101.1 names, e.g. iso_a4_210x297mm
+CONVERT_JPEG_QUALITY = 90
+# Frames that would only shrink to more than this fraction of their size are left alone: resampling
+# every strip costs more time than the smaller PDF saves
+CONVERT_MAX_RESAMPLE_SCALE = 0.75
+# JPEGs are decoded at reduced scale and uncompressed images (e.g. TIFF scans) are read a band of rows
+# at a time, so these scans can go well beyond Pillow's decompression-bomb limit
+CONVERT_MAX_STREAMED_PIXELS = 400_000_000
+# Everything else (PNG, compressed TIFF, ...) is decoded whole, so its memory use is NOT bounded;
+# these keep the limit at which Pillow itself refuses to open an image
+CONVERT_MAX_SOURCE_PIXELS = 2 * Image.MAX_IMAGE_PIXELS
+
+def raw_row_bytes(mode, rawmode, width):
+    """Bytes in a row of width pixels stored as rawmode, or None if Pillow cannot tell"""
+    try:
+        return len(Image.new(mode, (width, 1)).tobytes('raw', rawmode))
+    except (ValueError, OSError):
+        return None
+
+def raw_tiles(image):
+    """Return the current frame's tiles as (box, offset, rawmode, stride, orientation) if it is stored
+    uncompressed, so any band of rows can be read on its own; otherwise None"""
+    if not getattr(image, 'tile', None):
+        return None
+    tiles = []
+    for codec, box, offset, args in image.tile:
+        if codec != 'raw':
+            return None
+        args = args if isinstance(args, tuple) else (args,)
+        # Missing stride and orientation default to packed rows, top row first
+        rawmode, stride, orientation = args + (0, 1)[len(args) - 1:]
+        stride = stride or raw_row_bytes(image.mode, rawmode, box[2] - box[0])
+        if not stride:
+            return None
+        tiles.append((box, offset, rawmode, stride, orientation))
+    return tiles
+
+def read_raw_band(image, tiles, top, bottom):
+    """Decode rows top to bottom of an uncompressed image, reading only the bytes of those rows"""
+    band = Image.new(image.mode, (image.width, bottom - top))
+    if image.mode == 'P' and image.palette:
+        band.putpalette(image.palette.palette, image.palette.rawmode or image.palette.mode)
+    if 'transparency' in image.info:
+        band.info['transparency'] = image.info['transparency']
+    for (x0, y0, x1, y1), offset, rawmode, stride, orientation in tiles:
+        first, last = max(top, y0), min(bottom, y1)
+        if first >= last:
+            continue
+        # Bottom-up images store their last row first
+        row = first - y0 if orientation > 0 else y1 - last
+        image.fp.seek(offset + row * stride)
+        data = image.fp.read((last - first) * stride)
+        band.paste(Image.frombytes(image.mode, (x1 - x0, last - first), data, 'raw', rawmode, stride, orientation),
+                   (x0, first - top))
+    return band
+
+def check_image_size(image):
+    """Raise DecompressionBombError if the current frame is too large to convert safely"""
+    streamed = image.format == 'JPEG' or raw_tiles(image) is not None
+    limit = CONVERT_MAX_STREAMED_PIXELS if streamed else CONVERT_MAX_SOURCE_PIXELS
+    if image.width * image.height > limit:
+        raise Image.DecompressionBombError(f"Image size ({image.width}x{image.height} pixels) "
+                                           f"exceeds the {limit} pixel limit")
+
+def open_image(file_path):
+    """Open an image, raising DecompressionBombError if it is too large to convert safely"""
+    with open(file_path, 'rb') as f:
+        header = f.read(4)
+    # JPEG and TIFF plugins are opened directly to skip Pillow's process-wide pixel limit
+    if header[:3] == b'\xff\xd8\xff':
+        image = JpegImagePlugin.JpegImageFile(file_path)
+    elif header in (b'II*\0', b'MM\0*'):
+        image = TiffImagePlugin.TiffImageFile(file_path)
+    else:
+        image = Image.open(file_path)
+    try:
+        check_image_size(image)
+    except Image.DecompressionBombError:
+        image.close()
+        raise
+    return image
+
+def media_inches(media):
+    """Return (width, height) in inches for a PWG media name, or None if it has no size"""
+    match = MEDIA_SIZE.search(media or '')
+    if not match:
+        return None
+    width, height = float(match[1]), float(match[2])
+    return (width / 25.4, height / 25.4) if match[3] == 'mm' else (width, height)
+
+def image_page_inches(pixel_size, dpi, media=CONVERT_PAGE_INCHES):
+    """Page size for an image: from its own resolution if it records one, otherwise filling media"""
+    width, height = pixel_size
+    if dpi and len(dpi) == 2 and all(value > 0 for value in dpi):
+        return width / dpi[0], height / dpi[1]
+    # Turn the media to match the image, then scale the image up or down to fill it
+    media_width, media_height = sorted(media) if width <= height else sorted(media, reverse=True)
+    inches_per_pixel = min(media_width / width, media_height / height)
+    return width * inches_per_pixel, height * inches_per_pixel
+
+def flatten_strip(strip):
+    """Return an RGB or L copy of an image strip with transparency composited onto white"""
+    if strip.mode == 'PA' or (strip.mode == 'P' and 'transparency' in strip.info):
+        strip = strip.convert('RGBA')
+    if strip.mode in ('RGBA', 'LA'):
+        background = Image.new(strip.mode[:-1], strip.size, 'white')
+        background.paste(strip, mask=strip.getchannel('A'))
+        return background
+    if strip.mode in ('RGB', 'L'):
+        return strip
+    if strip.mode == '1':
+        return strip.convert('L')
+    return strip.convert('RGB')
+
+class ImagePdfWriter:
+    """Write image pages to a PDF incrementally, one horizontal strip at a time"""
+    
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3  # 1 is the catalog, 2 the page tree
+        f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    
+    def new_id(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+    
+    def write_object(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.f.tell()
+        if stream is None:
+            self.f.write(f"{obj_id} 0 obj\n{body}\nendobj\n".encode())
+        else:
+            self.f.write(f"{obj_id} 0 obj\n<< {body} /Length {len(stream)} >>\nstream\n".encode())
+            self.f.write(stream)
+            self.f.write(b'\nendstream\nendobj\n')
+    
+    def add_page(self, frame, page_inches, max_pixels=None):
+        """Add a page of page_inches (width, height) showing frame
+
+        Frames above max_pixels are scaled down strip by strip as they are encoded.
+        """
+        width, height = frame.size
+        page_width = page_inches[0] * 72
+        page_height = page_inches[1] * 72
+        row_height = page_height / height
+        rows = max(16, CONVERT_STRIP_PIXELS // width)
+        scale = min(1.0, math.sqrt(max_pixels / (width * height))) if max_pixels else 1.0
+        if scale > CONVERT_MAX_RESAMPLE_SCALE:
+            scale = 1.0
+        # Uncompressed frames are read band by band; cropping would decode the whole frame
+        tiles = raw_tiles(frame)
+        scaled_width = max(1, round(width * scale))
+        
+        xobjects = []
+        content = []
+        for top in range(0, height, rows):
+            # Overlap strips by one row so viewers never show hairline seams
+            bottom = min(top + rows + 1, height)
+            if tiles:
+                strip = flatten_strip(read_raw_band(frame, tiles, top, bottom))
+            else:
+                strip = flatten_strip(frame.crop((0, top, width, bottom)))
+            if scale < 1:
+                strip = strip.resize((scaled_width, max(1, round((bottom - top) * scale))), Image.LANCZOS)
+            buffer = io.BytesIO()
+            strip.save(buffer, 'JPEG', quality=CONVERT_JPEG_QUALITY)
+            colorspace = '/DeviceGray' if strip.mode == 'L' else '/DeviceRGB'
+            xobject_id = self.new_id()
+            self.write_object(xobject_id, f"/Type /XObject /Subtype /Image /Width {strip.width} "
+                                          f"/Height {strip.height} /ColorSpace {colorspace} "
+                                          f"/BitsPerComponent 8 /Filter /DCTDecode", buffer.getvalue())
+            name = f"Im{len(xobjects)}"
+            xobjects.append(f"/{name} {xobject_id} 0 R")
+            content.append(f"q {page_width:.4f} 0 0 {(bottom - top) * row_height:.4f} "
+                           f"0 {page_height - bottom * row_height:.4f} cm /{name} Do Q")
+        
+        content_id = self.new_id()
+        self.write_object(content_id, '', '\n'.join(content).encode())
+        page_id = self.new_id()
+        self.write_object(page_id, f"<< /Type /Page /Parent 2 0 R "
+                                   f"/MediaBox [0 0 {page_width:.4f} {page_height:.4f}] "
+                                   f"/Resources << /XObject << {' '.join(xobjects)} >> >> "
+                                   f"/Contents {content_id} 0 R >>")
+        self.page_ids.append(page_id)
+    
+    def close(self):
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self.write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>")
+        self.write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self.f.tell()
+        self.f.write(f"xref\n0 {self.next_id}\n0000000000 65535 f \n".encode())
+        for obj_id in range(1, self.next_id):
+            self.f.write(f"{self.offsets[obj_id]:010d} 00000 n \n".encode())
+        self.f.write(f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n".encode())
+
+def write_image_pdf(image, pdf_path, max_pixels=CONVERT_MAX_PIXELS, media=CONVERT_PAGE_INCHES):
+    """Write every frame of an image to a PDF without holding extra full-size copies"""
+    page_size = image.size
+    dpi = image.info.get('dpi')
+    if image.format == 'JPEG' and image.width * image.height > max_pixels:
+        # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 instead of decoding every pixel
+        scale = math.sqrt(max_pixels / (image.width * image.height))
+        image.draft(image.mode, (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        logger.debug(f"Decoding {page_size} JPEG at reduced size {image.size}")
+    
+    frames = getattr(image, 'n_frames', 1)
+    try:
+        with open(pdf_path, 'wb') as f:
+            writer = ImagePdfWriter(f)
+            for index in range(frames):
+                image.seek(index)
+                if index:
+                    check_image_size(image)
+                    page_size, dpi = image.size, image.info.get('dpi')
+                writer.add_page(image, image_page_inches(page_size, dpi, media), max_pixels)
+            writer.close()
+    except Exception:
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
+        raise
+    return frames
+
+def image_frame_count(file_path):
+    """Number of frames or pages in an image file, or None if it cannot be read"""
+    try:
+        with open_image(file_path) as image:
+            return getattr(image, 'n_frames', 1)
+    except Exception:
+        return None
+
+@tracing.traced('convert')
+def convert_to_pdf_if_needed(file_path, profile=None):
     """Convert image files to PDF for better printing compatibility"""
     mime_type = get_file_type(file_path)
     
@@ -78,20 +501,28 @@ def convert_to_pdf_if_needed(file_path):
     
     # If it's an image, convert to PDF
     if mime_type.startswith('image/'):
+        if profile and mime_type in profile['formats'] and image_frame_count(file_path) == 1:
+            # Printers print only the first frame of animated or multi-page images themselves
+            logger.info(f"Printer accepts {mime_type} natively, skipping conversion")
+            return file_path
+        
+        max_pixels = CONVERT_MAX_PIXELS
+        media = CONVERT_PAGE_INCHES
+        if profile:
+            media = media_inches(profile['media_default']) or media
+            if profile['default_dpi']:
+                # No point rasterising beyond what the printer can reproduce; the page size is unaffected
+                dpi = profile['default_dpi']
+                max_pixels = int(media[0] * media[1] * dpi * dpi)
+        
         try:
             logger.info(f"Converting image {file_path} to PDF")
             pdf_path = os.path.splitext(file_path)[0] + ".pdf"
             
             try:
-                image = Image.open(file_path)
-                # Convert to RGB if needed (for PNG with transparency)
-                if image.mode in ('RGBA', 'LA'):
-                    background = Image.new("RGB", image.size, (255, 255, 255))
-                    background.paste(image, mask=image.split()[3])  # 3 is the alpha channel
-                    image = background
-                
-                image.save(pdf_path, "PDF", resolution=100.0)
-                logger.info(f"Successfully converted image to PDF: {pdf_path}")
+                with open_image(file_path) as image:
+                    pages = write_image_pdf(image, pdf_path, max_pixels, media)
+                logger.info(f"Successfully converted image to PDF ({pages} pages): {pdf_path}")
                 return pdf_path
             except UnidentifiedImageError:
                 logger.error(f"Could not identify image format for {file_path}")
@@ -102,33 +533,233 @@ def convert_to_pdf_if_needed(file_path):
     
     return file_path
 
-def print_to_airprint(printer_info, document_path):
-    """Print a document to an AirPrint printer"""
-    logger.debug(f"Attempting to print {document_path} to {printer_info['name']}")
+# PDF payload optimisation before sending (OPTIMIZE_PDF = False disables it)
+OPTIMIZE_PDF = False
+OPTIMIZE_TARGET_DPI = 300  # embedded images above this are downsampled
+OPTIMIZE_MIN_BYTES = 512 * 1024  # smaller PDFs are sent as they are
+OPTIMIZE_MIN_SAVING = 0.1  # keep the original unless the result is at least this much smaller
+OPTIMIZE_MIN_STREAM_BYTES = 1024  # uncompressed streams below this are left alone
+OPTIMIZE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'printit_optimize_cache')
+OPTIMIZE_CACHE_MAX_ENTRIES = 200
+
+def flate_stream(stream, data, filter_name='/FlateDecode', **entries):
+    """Return a copy of a stream dictionary holding already-encoded data"""
+    encoded = EncodedStreamObject()
+    for key, value in stream.items():
+        if key not in ('/Length', '/Filter', '/DecodeParms'):
+            encoded[key] = value
+    encoded[NameObject('/Filter')] = NameObject(filter_name)
+    for key, value in entries.items():
+        encoded[NameObject('/' + key)] = NumberObject(value)
+    encoded._data = data
+    return encoded
+
+def downsample_pdf_image(stream, page_inches, target_dpi):
+    """Return a smaller copy of an image XObject stored above target_dpi, or None"""
+    def entry(key):
+        return stream[key] if key in stream else None
     
-    if not os.path.exists(document_path):
-        logger.error(f"Document not found: {document_path}")
-        return False, f"Document not found: {document_path}"
+    filters = entry('/Filter')
+    if isinstance(filters, ArrayObject) and len(filters) == 1:
+        filters = filters[0].get_object()
+    mode = {'/DeviceRGB': 'RGB', '/DeviceGray': 'L'}.get(entry('/ColorSpace'))
+    if (mode is None or entry('/ImageMask') or entry('/BitsPerComponent') != 8
+            or filters not in ('/DCTDecode', '/FlateDecode', None) or isinstance(entry('/Mask'), ArrayObject)):
+        return None
     
-    # Try to convert document to PDF for better compatibility
-    converted_path = convert_to_pdf_if_needed(document_path)
-    if converted_path != document_path:
-        logger.info(f"Using converted document: {converted_path}")
-        document_path = converted_path
+    # Images are assumed not to be drawn larger than the page, so this never overestimates their DPI
+    width, height = int(entry('/Width')), int(entry('/Height'))
+    scale = target_dpi * page_inches / max(width, height)
+    if scale >= 1:
+        return None
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
     
+    if filters == '/DCTDecode':
+        image = Image.open(io.BytesIO(stream._data))
+        image.draft(mode, size)
+        if image.mode != mode:
+            return None
+        image = image.resize(size, Image.LANCZOS)
+        encoded = io.BytesIO()
+        image.save(encoded, 'JPEG', quality=CONVERT_JPEG_QUALITY)
+        smaller = flate_stream(stream, encoded.getvalue(), '/DCTDecode', Width=size[0], Height=size[1])
+    else:
+        # Flate images keep lossless compression; they are usually line art or text
+        image = Image.frombytes(mode, (width, height), stream.get_data()).resize(size, Image.LANCZOS)
+        smaller = flate_stream(stream, zlib.compress(image.tobytes()), Width=size[0], Height=size[1])
+    return smaller if len(smaller._data) < len(stream._data) else None
+
+def optimize_pdf_objects(reader, target_dpi):
+    """Swap oversized images and uncompressed streams for smaller copies in the reader's object cache"""
+    page_inches = max(max(float(page.mediabox.width), float(page.mediabox.height)) for page in reader.pages) / 72
+    counts = {'images': 0, 'streams': 0}
+    seen = set()
+    stack = list(reader.pages)
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, IndirectObject):
+            key = (obj.generation, obj.idnum)
+            if key in seen:
+                continue
+            seen.add(key)
+            resolved = obj.get_object()
+            if isinstance(resolved, StreamObject):
+                replacement = None
+                try:
+                    replacement = downsample_pdf_image(resolved, page_inches, target_dpi)
+                except Exception as e:
+                    logger.debug(f"Could not downsample image {obj.idnum}: {e}")
+                if replacement is not None:
+                    counts['images'] += 1
+                elif (isinstance(resolved, DecodedStreamObject) and '/Filter' not in resolved
+                      and len(resolved._data) >= OPTIMIZE_MIN_STREAM_BYTES):
+                    compressed = zlib.compress(resolved._data)
+                    if len(compressed) < len(resolved._data):
+                        replacement = flate_stream(resolved, compressed)
+                        counts['streams'] += 1
+                if replacement is not None:
+                    # PdfWriter resolves references through this cache when it copies the pages
+                    reader.resolved_objects[key] = replacement
+            stack.append(resolved)
+        elif isinstance(obj, DictionaryObject):
+            stack.extend(value for name, value in obj.items() if name != '/Parent')
+        elif isinstance(obj, ArrayObject):
+            stack.extend(obj)
+    return counts
+
+def write_optimized_pdf(document_path, cache_key, target_dpi):
+    """Optimise a PDF into the cache and return a summary of what it saved"""
+    started = time.monotonic()
+    original_size = os.path.getsize(document_path)
+    result = {'original_size': original_size, 'optimized_size': original_size, 'images': 0, 'streams': 0,
+              'worthwhile': False, 'error': None}
     try:
-        # Try to fix permission issues
+        reader = PdfReader(document_path, strict=False)
+        if reader.is_encrypted:
+            raise ValueError('PDF is encrypted')
+        result.update(optimize_pdf_objects(reader, target_dpi))
+        
+        # PdfWriter also merges objects with identical content, such as repeated fonts and images
+        writer = PdfWriter()
+        for page in reader.pages:
+            writer.add_page(page)
+        os.makedirs(OPTIMIZE_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=OPTIMIZE_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            writer.write(f)
+        result['optimized_size'] = os.path.getsize(tmp_path)
+        result['worthwhile'] = result['optimized_size'] <= original_size * (1 - OPTIMIZE_MIN_SAVING)
+        if result['worthwhile']:
+            os.replace(tmp_path, os.path.join(OPTIMIZE_CACHE_DIR, cache_key + '.pdf'))
+        else:
+            os.remove(tmp_path)
+    except Exception as e:
+        logger.warning(f"Could not optimise {document_path}: {e}")
+        result['error'] = str(e)
+    result['seconds'] = round(time.monotonic() - started, 3)
+    
+    # Remember the outcome either way so a resubmission does not repeat the work
+    try:
+        os.makedirs(OPTIMIZE_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=OPTIMIZE_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, os.path.join(OPTIMIZE_CACHE_DIR, cache_key + '.json'))
+        prune_cache(OPTIMIZE_CACHE_DIR, OPTIMIZE_CACHE_MAX_ENTRIES, extra_suffixes=('.pdf',))
+    except OSError as e:
+        logger.warning(f"Could not write optimisation cache: {e}")
+    return result
+
+def optimize_pdf(document_path, target_dpi=None):
+    """Return the path of a smaller copy of a PDF to send, or document_path if that does not pay off"""
+    target_dpi = target_dpi or OPTIMIZE_TARGET_DPI
+    file_size = os.path.getsize(document_path)
+    with open(document_path, 'rb') as f:
+        is_pdf = b'%PDF-' in f.read(1024)
+    if not is_pdf or file_size < OPTIMIZE_MIN_BYTES:
+        return document_path
+    
+    with tracing.span('optimize', file_size=file_size, target_dpi=target_dpi) as span:
+        cache_key = f"{file_content_hash(document_path)}-{target_dpi}"
+        cached = True
         try:
-            os.chmod(document_path, 0o644)  # Make file readable by printer processes
-        except Exception as e:
-            logger.warning(f"Could not set file permissions: {e}")
+            with open(os.path.join(OPTIMIZE_CACHE_DIR, cache_key + '.json')) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            cached = False
+            result = write_optimized_pdf(document_path, cache_key, target_dpi)
+        span['attrs'].update(cached=cached, optimized_size=result['optimized_size'],
+                             worthwhile=result['worthwhile'])
         
-        if platform.system() == 'Darwin':  # macOS
-            # Create a separate helper script to run commands with correct environment
-            helper_script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'print_helper.sh')
-            
-            with open(helper_script_path, 'w') as f:
-                f.write(f'''#!/bin/bash
+        saving = 1 - result['optimized_size'] / result['original_size']
+        logger.info(f"Optimised {os.path.basename(document_path)}: {result['original_size'] / 1e6:.2f} MB -> "
+                    f"{result['optimized_size'] / 1e6:.2f} MB ({saving:.0%} smaller, {result['images']} images "
+                    f"downsampled, {result['streams']} streams compressed) in {result['seconds']}s"
+                    f"{' (cached)' if cached else ''}")
+        if not result['worthwhile']:
+            logger.info(f"Sending original {os.path.basename(document_path)}; optimisation does not pay off")
+            return document_path
+        
+        # Give each job its own copy so chunking and cache eviction cannot interfere
+        optimized_path = os.path.splitext(document_path)[0] + '.optimized.pdf'
+        cached_path = os.path.join(OPTIMIZE_CACHE_DIR, cache_key + '.pdf')
+        try:
+            try:
+                os.link(cached_path, optimized_path)
+            except OSError:
+                shutil.copyfile(cached_path, optimized_path)
+        except OSError as e:
+            logger.warning(f"Could not use optimised copy of {document_path}: {e}")
+            return document_path
+        return optimized_path
+
+def run_command(cmd, **kwargs):
+    """subprocess.run recorded as a trace span named after the command
+
+    Inside a print job the process is registered so that cancelling the job can kill it.
+    """
+    with tracing.span(f"exec {os.path.basename(cmd[0])}"):
+        job_id = current_job_id.get()
+        if job_id is None:
+            return subprocess.run(cmd, **kwargs)
+        return run_job_process(job_id, cmd, **kwargs)
+
+def run_job_process(job_id, cmd, capture_output=False, timeout=None, check=False, **kwargs):
+    """subprocess.run for a job's commands, killable from any worker through the job registry"""
+    if capture_output:
+        kwargs['stdout'] = kwargs['stderr'] = subprocess.PIPE
+    # A process group of its own lets cancellation stop helper scripts together with their children
+    with subprocess.Popen(cmd, start_new_session=os.name == 'posix', **kwargs) as process:
+        conn = jobs_connection()
+        try:
+            conn.execute('INSERT OR REPLACE INTO job_processes VALUES (?, ?)', (job_id, process.pid))
+        finally:
+            conn.close()
+        try:
+            # The job may have been cancelled just before the process was registered
+            if job_cancel_requested(job_id):
+                kill_job_processes([process.pid])
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        finally:
+            conn = jobs_connection()
+            try:
+                conn.execute('DELETE FROM job_processes WHERE job_id = ? AND pid = ?', (job_id, process.pid))
+            finally:
+                conn.close()
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+def send_with_helper_script(printer_info, document_path, timeout):
+    """macOS: print through a helper script that sets up the Homebrew environment"""
+    helper_script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'print_helper.sh')
+    
+    with open(helper_script_path, 'w') as f:
+        f.write(f'''#!/bin/bash
 set -e
 export PATH=$PATH:/usr/bin:/usr/local/bin:/opt/homebrew/bin
 export DYLD_LIBRARY_PATH=/usr/local/lib:/opt/homebrew/lib
@@ -152,144 +783,680 @@ fi
 
 echo "Print job sent. Check printer for output."
 ''')
-            
-            os.chmod(helper_script_path, 0o755)  # Make executable
-            
-            logger.debug(f"Running print helper script: {helper_script_path}")
-            
-            # Use os.system rather than subprocess for better shell support
-            cmd = f'{helper_script_path}'
-            return_code = os.system(cmd)
-            
-            if return_code == 0:
-                logger.info(f"Print helper script executed successfully")
-                return True, f"Document sent to {printer_info['name']}"
-            else:
-                logger.warning(f"Print helper script returned non-zero exit code: {return_code}")
-                
-                # Try one more direct approach
-                logger.debug("Trying direct command execution as fallback")
-                # Use safe quoted command to handle spaces in printer names
-                printer_name_safe = shlex.quote(printer_info['name'])
-                document_path_safe = shlex.quote(document_path)
-                direct_cmd = f"lp -d {printer_name_safe} {document_path_safe}"
-                
-                try:
-                    direct_result = os.system(direct_cmd)
-                    if direct_result == 0:
-                        return True, f"Document sent to {printer_info['name']} using direct lp command"
-                    else:
-                        # Even with errors, let's assume it might have printed
-                        logger.warning(f"Direct command returned code {direct_result}, but proceeding anyway")
-                        return True, f"Print job submitted to {printer_info['name']} (check printer)"
-                except Exception as direct_e:
-                    logger.error(f"Direct printing failed: {direct_e}")
-                    return False, f"All printing methods failed"
-            
-        elif platform.system() == 'Windows':
-            # For Windows, we need to map the network printer first
-            printer_uri = f"http://{printer_info['ip']}:{printer_info['port']}/ipp/print"
-            
-            # First try to add the printer if it doesn't exist
-            add_cmd = ['rundll32.exe', 'printui.dll,PrintUIEntry', '/ga', '/n', printer_uri]
-            logger.debug(f"Running command: {' '.join(add_cmd)}")
-            try:
-                subprocess.run(add_cmd, capture_output=True, text=True, timeout=30)
-            except subprocess.SubprocessError as e:
-                logger.warning(f"Error adding printer: {e}")
-            
-            # Then print the document
-            print_cmd = ['print', '/d:' + printer_uri, document_path]
-            logger.debug(f"Running command: {' '.join(print_cmd)}")
-            try:
-                result = subprocess.run(print_cmd, capture_output=True, text=True, check=True, timeout=60)
-                logger.debug(f"Command output: {result.stdout}")
-                if result.stderr:
-                    logger.warning(f"Command stderr: {result.stderr}")
-                return True, f"Document sent to {printer_info['name']}"
-            except subprocess.SubprocessError as e:
-                logger.error(f"Error printing document: {e}")
-                # Try alternative method
-                alt_cmd = ['powershell', '-command', f"Out-Printer -PrinterName '{printer_uri}' -FilePath '{document_path}'"]
-                logger.debug(f"Trying alternative command: {' '.join(alt_cmd)}")
-                try:
-                    result = subprocess.run(alt_cmd, capture_output=True, text=True, check=True, timeout=60)
-                    return True, f"Document sent to {printer_info['name']} using alternative method"
-                except subprocess.SubprocessError as alt_e:
-                    logger.error(f"Alternative print method failed: {alt_e}")
-                    return False, f"Failed to print: {str(e)}, alternative method also failed: {str(alt_e)}"
-        
-        elif platform.system() == 'Linux':
-            # Using local CUPS for Linux
+    
+    os.chmod(helper_script_path, 0o755)  # Make executable
+    
+    logger.debug(f"Running print helper script: {helper_script_path}")
+    run_command([helper_script_path], check=True, timeout=timeout)
+    return True, f"Document sent to {printer_info['name']}"
+
+def send_with_lp(printer_info, document_path, timeout):
+    """Print via the local CUPS lp command"""
+    cmd = ['lp', '-d', printer_info['name']]
+    priority = job_priority()
+    if priority:
+        cmd += ['-q', str(priority)]
+    cmd.append(document_path)
+    logger.debug(f"Running command: {' '.join(cmd)}")
+    result = run_command(cmd, capture_output=True, text=True, check=True, timeout=timeout)
+    logger.debug(f"Command output: {result.stdout}")
+    if result.stderr:
+        logger.warning(f"Command stderr: {result.stderr}")
+    record_lp_request_id(result.stdout, printer_info)
+    return True, f"Document sent to {printer_info['name']}"
+
+def send_with_lpr(printer_info, document_path, timeout):
+    """Print via the BSD-style lpr command"""
+    cmd = ['lpr', '-P', printer_info['name'], '-o', 'raw', document_path]
+    logger.debug(f"Running command: {' '.join(cmd)}")
+    run_command(cmd, capture_output=True, text=True, check=True, timeout=timeout)
+    return True, f"Document sent to {printer_info['name']} using alternative method"
+
+def send_with_windows_print(printer_info, document_path, timeout):
+    """Windows: map the network printer, then use the print command"""
+    printer_uri = f"http://{printer_info['ip']}:{printer_info['port']}/ipp/print"
+    
+    # First try to add the printer if it doesn't exist
+    add_cmd = ['rundll32.exe', 'printui.dll,PrintUIEntry', '/ga', '/n', printer_uri]
+    logger.debug(f"Running command: {' '.join(add_cmd)}")
+    try:
+        run_command(add_cmd, capture_output=True, text=True, timeout=30)
+    except subprocess.SubprocessError as e:
+        logger.warning(f"Error adding printer: {e}")
+    
+    # Then print the document
+    print_cmd = ['print', '/d:' + printer_uri, document_path]
+    logger.debug(f"Running command: {' '.join(print_cmd)}")
+    result = run_command(print_cmd, capture_output=True, text=True, check=True, timeout=timeout)
+    logger.debug(f"Command output: {result.stdout}")
+    if result.stderr:
+        logger.warning(f"Command stderr: {result.stderr}")
+    return True, f"Document sent to {printer_info['name']}"
+
+def send_with_powershell(printer_info, document_path, timeout):
+    """Windows: print with PowerShell's Out-Printer"""
+    printer_uri = f"http://{printer_info['ip']}:{printer_info['port']}/ipp/print"
+    cmd = ['powershell', '-command', f"Out-Printer -PrinterName '{printer_uri}' -FilePath '{document_path}'"]
+    logger.debug(f"Running command: {' '.join(cmd)}")
+    run_command(cmd, capture_output=True, text=True, check=True, timeout=timeout)
+    return True, f"Document sent to {printer_info['name']} using alternative method"
+
+# Submission methods per OS, in the order tried before anything has been learned
+PLATFORM_TRANSPORTS = {
+    'Darwin': [('helper', send_with_helper_script), ('lp', send_with_lp)],
+    'Windows': [('print', send_with_windows_print), ('powershell', send_with_powershell)],
+    'Linux': [('lp', send_with_lp), ('lpr', send_with_lpr)]
+}
+
+# Adaptive transport selection: per printer and method, an exponentially weighted
+# success rate and time per megabyte decide the order methods are tried in and their timeouts
+TRANSPORT_EWMA_ALPHA = 0.3
+TRANSPORT_PRIOR_RATE = 0.75  # success rate assumed for a method never tried; below it a method is reprobed
+TRANSPORT_DEFAULT_TIMEOUT = 60
+TRANSPORT_MIN_TIMEOUT = 10
+TRANSPORT_TIMEOUT_FACTOR = 4  # timeout as a multiple of the method's typical time for the document's size
+TRANSPORT_FLOOR_SECONDS_PER_MB = 2.0  # every timeout allows at least this, i.e. a 0.5 MB/s link
+TRANSPORT_FALLBACK_TIMEOUT = 20  # cap for methods tried after the preferred one failed
+TRANSPORT_REPROBE_INTERVAL = 300
+TRANSPORT_STATS = {}  # (printer name, method) -> stats dict
+transport_stats_lock = threading.Lock()
+transport_reprober_pid = None
+
+def transport_stats(printer_info, name):
+    key = (printer_info['name'], name)
+    if key not in TRANSPORT_STATS:
+        TRANSPORT_STATS[key] = {'printer': printer_info, 'success_rate': TRANSPORT_PRIOR_RATE,
+                                'seconds_per_mb': None, 'attempts': 0, 'failures': 0}
+    return TRANSPORT_STATS[key]
+
+def rank_transports(printer_info, transports):
+    """Order transports by success rate, then time per megabyte; untried ones keep their default order"""
+    def rank(transport):
+        stats = transport_stats(printer_info, transport[0])
+        return -round(stats['success_rate'], 2), stats['seconds_per_mb'] or 0.0
+    with transport_stats_lock:
+        return sorted(transports, key=rank)
+
+def transport_size_mb(document_path):
+    """Document size in megabytes, counting anything under one as one so fixed costs dominate"""
+    try:
+        return max(1.0, os.path.getsize(document_path) / (1024 * 1024))
+    except OSError:
+        return 1.0
+
+def transport_timeout(printer_info, name, preferred, size_mb=1.0):
+    with transport_stats_lock:
+        seconds_per_mb = transport_stats(printer_info, name)['seconds_per_mb']
+    # Fast small jobs must not shrink the timeout below what a large document needs
+    floor = TRANSPORT_MIN_TIMEOUT + size_mb * TRANSPORT_FLOOR_SECONDS_PER_MB
+    timeout = max(TRANSPORT_DEFAULT_TIMEOUT, floor)
+    if seconds_per_mb is not None:
+        timeout = min(timeout, max(floor, seconds_per_mb * size_mb * TRANSPORT_TIMEOUT_FACTOR))
+    if not preferred:
+        timeout = min(timeout, max(TRANSPORT_FALLBACK_TIMEOUT, floor))
+    return timeout
+
+def record_transport_result(printer_info, name, success, seconds, size_mb=1.0):
+    global transport_reprober_pid
+    with transport_stats_lock:
+        stats = transport_stats(printer_info, name)
+        stats['attempts'] += 1
+        stats['success_rate'] += TRANSPORT_EWMA_ALPHA * ((1.0 if success else 0.0) - stats['success_rate'])
+        if success:
+            rate, observed = stats['seconds_per_mb'], seconds / size_mb
+            stats['seconds_per_mb'] = observed if rate is None else rate + TRANSPORT_EWMA_ALPHA * (observed - rate)
+        else:
+            stats['failures'] += 1
+        if not success and transport_reprober_pid != os.getpid():
+            transport_reprober_pid = os.getpid()
+            threading.Thread(target=reprobe_transports, name='transport-reprober', daemon=True).start()
+
+def submit_with_transports(printer_info, document_path, transports):
+    """Try submission methods best-first until one succeeds"""
+    errors = []
+    size_mb = transport_size_mb(document_path)
+    for index, (name, send) in enumerate(rank_transports(printer_info, transports)):
+        timeout = transport_timeout(printer_info, name, preferred=index == 0, size_mb=size_mb)
+        if index:
+            logger.debug(f"Trying alternative method {name} (timeout {timeout:.0f}s)")
+        started = time.monotonic()
+        try:
+            success, message = send(printer_info, document_path, timeout)
+        except (subprocess.SubprocessError, OSError) as e:
+            success, message = False, str(e)
+        if not success and job_cancel_requested():
+            # Killed by a cancel request, which says nothing about the transport
+            return False, JOB_CANCELED_MESSAGE
+        record_transport_result(printer_info, name, success, time.monotonic() - started, size_mb)
+        if success:
+            return True, message
+        logger.error(f"Print method {name} failed: {message}")
+        errors.append(f"{name}: {message}")
+    return False, f"All printing methods failed: {'; '.join(errors)}"
+
+def probe_cups_queue(printer_info):
+    """Check that the CUPS queue exists and is accepting jobs, without printing"""
+    result = subprocess.run(['lpstat', '-a', printer_info['name']], capture_output=True, timeout=10)
+    return result.returncode == 0
+
+TRANSPORT_PROBES = {
+    'lp': probe_cups_queue,
+    'lpr': probe_cups_queue
+}
+
+def reprobe_transports():
+    """Periodically give demoted methods that pass a cheap check another chance"""
+    while True:
+        time.sleep(TRANSPORT_REPROBE_INTERVAL)
+        with transport_stats_lock:
+            demoted = [(key, stats) for key, stats in TRANSPORT_STATS.items()
+                       if stats['success_rate'] < TRANSPORT_PRIOR_RATE and key[1] in TRANSPORT_PROBES]
+        for (printer_name, name), stats in demoted:
             try:
-                # Try different printing methods based on available commands
-                if shutil.which('lp'):
-                    # Direct printing via local CUPS instead of adding printer
-                    cmd = ['lp', '-d', printer_info['name'], document_path]
-                    logger.debug(f"Running command: {' '.join(cmd)}")
-                    try:
-                        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=60)
-                        logger.debug(f"Command output: {result.stdout}")
-                        if result.stderr:
-                            logger.warning(f"Command stderr: {result.stderr}")
-                        return True, f"Document sent to {printer_info['name']}"
-                    except subprocess.SubprocessError as e:
-                        logger.error(f"Error printing document: {e}")
-                        # Try alternative method using CUPS directly
-                        alt_cmd = ['lpr', '-P', printer_info['name'], '-o', 'raw', document_path]
-                        logger.debug(f"Trying alternative command: {' '.join(alt_cmd)}")
-                        try:
-                            result = subprocess.run(alt_cmd, capture_output=True, text=True, check=True, timeout=60)
-                            return True, f"Document sent to {printer_info['name']} using alternative method"
-                        except subprocess.SubprocessError as alt_e:
-                            logger.error(f"Alternative print method failed: {alt_e}")
-                            return False, f"Failed to print: {str(e)}, alternative method also failed: {str(alt_e)}"
-                elif shutil.which('lpr'):
-                    alt_cmd = ['lpr', '-P', printer_info['name'], '-o', 'raw', document_path]
-                    logger.debug(f"Trying alternative command: {' '.join(alt_cmd)}")
-                    try:
-                        result = subprocess.run(alt_cmd, capture_output=True, text=True, check=True, timeout=60)
-                        return True, f"Document sent to {printer_info['name']} using alternative method"
-                    except subprocess.SubprocessError as alt_e:
-                        logger.error(f"Alternative print method failed: {alt_e}")
-                        return False, f"Failed to print: {str(e)}, alternative method also failed: {str(alt_e)}"
+                available = TRANSPORT_PROBES[name](stats['printer'])
+            except (subprocess.SubprocessError, OSError):
+                available = False
+            with transport_stats_lock:
+                if available:
+                    stats['success_rate'] = TRANSPORT_PRIOR_RATE
                 else:
-                    logger.error("No printing command (lp/lpr) found. Install cups or lpr package.")
-                    return False, "Printing tools not installed. Install CUPS or LPR."
-            except Exception as e:
-                logger.error(f"Error printing document: {e}")
-                return False, f"Failed to print: {str(e)}"
-        else:
+                    stats['success_rate'] *= 1 - TRANSPORT_EWMA_ALPHA
+            logger.debug(f"Reprobed {name} for {printer_name}: {'available' if available else 'unavailable'}")
+
+@tracing.traced('submit')
+def print_to_airprint(printer_info, document_path):
+    """Print a document to an AirPrint printer"""
+    logger.debug(f"Attempting to print {document_path} to {printer_info['name']}")
+    
+    if not os.path.exists(document_path):
+        logger.error(f"Document not found: {document_path}")
+        return False, f"Document not found: {document_path}"
+    
+    # Direct socket transports need PDF; IPP queues report what they accept
+    profile = None
+    if printer_info.get('transport', 'cups') not in DIRECT_TRANSPORTS:
+        profile = get_printer_profile(printer_info)
+    
+    # Try to convert document to PDF for better compatibility
+    converted_path = convert_to_pdf_if_needed(document_path, profile)
+    if converted_path != document_path:
+        logger.info(f"Using converted document: {converted_path}")
+        document_path = converted_path
+    if job_cancel_requested():
+        return False, JOB_CANCELED_MESSAGE
+    
+    try:
+        # Try to fix permission issues
+        try:
+            os.chmod(document_path, 0o644)  # Make file readable by printer processes
+        except Exception as e:
+            logger.warning(f"Could not set file permissions: {e}")
+        
+        transport = printer_info.get('transport', 'cups')
+        if transport in DIRECT_TRANSPORTS:
+            return DIRECT_TRANSPORTS[transport](printer_info, document_path)
+        
+        if platform.system() not in PLATFORM_TRANSPORTS:
             msg = f"Unsupported operating system: {platform.system()}"
             logger.error(msg)
             return False, msg
+        transports = [(name, send) for name, send in PLATFORM_TRANSPORTS[platform.system()]
+                      if platform.system() != 'Linux' or shutil.which(name)]
+        if not transports:
+            logger.error("No printing command (lp/lpr) found. Install cups or lpr package.")
+            return False, "Printing tools not installed. Install CUPS or LPR."
+        return submit_with_transports(printer_info, document_path, transports)
     except Exception as e:
         error_msg = f"Unexpected error printing document: {str(e)}"
         logger.exception(error_msg)
         return False, error_msg
 
-def test_printer_connection(printer_info):
+# Last connection test result per (ip, port): (reachable, time.monotonic())
+PRINTER_REACHABILITY = {}
+REACHABILITY_TTL = 30
+
+def transport_port(printer_info):
+    """Return the port used by the printer's configured transport"""
+    transport = printer_info.get('transport', 'cups')
+    if transport == 'raw':
+        return printer_info.get('raw_port', RAW_PORT)
+    if transport == 'lpd':
+        return printer_info.get('lpd_port', LPD_PORT)
+    return printer_info['port']
+
+@tracing.traced('probe')
+def test_printer_connection(printer_info, port=None):
     """Test if we can connect to the printer"""
+    port = port or printer_info['port']
     try:
-        logger.debug(f"Testing connection to printer at {printer_info['ip']}:{printer_info['port']}")
+        logger.debug(f"Testing connection to printer at {printer_info['ip']}:{port}")
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.settimeout(5)
-        s.connect((printer_info['ip'], printer_info['port']))
+        s.connect((printer_info['ip'], port))
         s.close()
+        PRINTER_REACHABILITY[(printer_info['ip'], port)] = (True, time.monotonic())
         logger.debug("Connection successful")
         return True, "Connection successful"
     except Exception as e:
+        PRINTER_REACHABILITY[(printer_info['ip'], port)] = (False, time.monotonic())
         logger.error(f"Could not connect to printer: {e}")
         return False, f"Connection failed: {str(e)}"
 
-def handle_document(document_path, printer_name=None):
+def recently_unreachable(ip, port):
+    """Return True if the last connection test to ip:port failed within REACHABILITY_TTL"""
+    reachable, checked = PRINTER_REACHABILITY.get((ip, port), (True, 0))
+    return not reachable and time.monotonic() - checked < REACHABILITY_TTL
+
+# Direct socket transports
+RAW_PORT = 9100
+LPD_PORT = 515
+TRANSPORT_TIMEOUT = 60
+lpd_job_counter = itertools.count(uuid.uuid4().int % 1000)
+
+def open_printer_socket(printer_info, port):
+    """Connect to the printer, failing fast if it was just found to be unreachable"""
+    if recently_unreachable(printer_info['ip'], port):
+        raise ConnectionError(f"{printer_info['ip']}:{port} failed a connection test in the last {REACHABILITY_TTL}s")
+    try:
+        sock = socket.create_connection((printer_info['ip'], port), timeout=TRANSPORT_TIMEOUT)
+    except OSError:
+        PRINTER_REACHABILITY[(printer_info['ip'], port)] = (False, time.monotonic())
+        raise
+    PRINTER_REACHABILITY[(printer_info['ip'], port)] = (True, time.monotonic())
+    return sock
+
+def print_raw_socket(printer_info, document_path):
+    """Send a document to a JetDirect (port 9100) printer with zero-copy sendfile"""
+    port = printer_info.get('raw_port', RAW_PORT)
+    logger.debug(f"Sending {document_path} to {printer_info['ip']}:{port} (raw)")
+    try:
+        with open_printer_socket(printer_info, port) as sock, open(document_path, 'rb') as f:
+            sent = sock.sendfile(f)
+            # Closing our side marks the end of the job
+            sock.shutdown(socket.SHUT_WR)
+        logger.info(f"Sent {sent} bytes to {printer_info['name']} over raw socket")
+        return True, f"Document sent to {printer_info['name']} (raw port {port})"
+    except OSError as e:
+        logger.error(f"Raw socket printing failed: {e}")
+        return False, f"Raw socket printing failed: {str(e)}"
+
+def lpd_command(sock, command):
+    """Send an LPD command and check the printer's acknowledgement byte"""
+    sock.sendall(command)
+    ack = sock.recv(1)
+    if ack != b'\0':
+        raise ConnectionError(f"LPD server refused command {command[:1]!r} (reply {ack!r})")
+
+def print_lpd(printer_info, document_path):
+    """Send a document to an LPD (port 515) queue as described in RFC 1179"""
+    port = printer_info.get('lpd_port', LPD_PORT)
+    lpd_queue = printer_info.get('lpd_queue', 'lp')
+    host = socket.gethostname().split('.')[0][:31]
+    job = f"{next(lpd_job_counter) % 1000:03d}"
+    data_name = f"dfA{job}{host}"
+    control = (f"H{host}\nP{getpass.getuser()}\nJ{os.path.basename(document_path)}\n"
+               f"l{data_name}\nU{data_name}\nN{os.path.basename(document_path)}\n").encode()
+    size = os.path.getsize(document_path)
+    logger.debug(f"Sending {document_path} to {printer_info['ip']}:{port} queue {lpd_queue} (LPD)")
+    try:
+        with open_printer_socket(printer_info, port) as sock, open(document_path, 'rb') as f:
+            lpd_command(sock, f"\x02{lpd_queue}\n".encode())
+            lpd_command(sock, f"\x02{len(control)} cfA{job}{host}\n".encode())
+            lpd_command(sock, control + b'\0')
+            lpd_command(sock, f"\x03{size} {data_name}\n".encode())
+            sock.sendfile(f)
+            lpd_command(sock, b'\0')
+        logger.info(f"Sent {size} bytes to {printer_info['name']} queue {lpd_queue} over LPD")
+        return True, f"Document sent to {printer_info['name']} (LPD queue {lpd_queue})"
+    except OSError as e:
+        logger.error(f"LPD printing failed: {e}")
+        return False, f"LPD printing failed: {str(e)}"
+
+DIRECT_TRANSPORTS = {
+    'raw': print_raw_socket,
+    'lpd': print_lpd
+}
+
+# IPP printer capability profiles, fetched once per printer and refreshed after PROFILE_TTL
+PROFILE_TTL = 3600
+PROFILE_RETRY_TTL = 60  # how long to wait before asking again after a failed fetch
+PROFILE_TIMEOUT = 5
+PROFILE_ATTRIBUTES = [
+    'document-format-supported',
+    'printer-resolution-supported',
+    'printer-resolution-default',
+    'pwg-raster-document-resolution-supported',
+    'urf-supported',
+    'media-supported',
+    'media-default',
+    'sides-supported'
+]
+PRINTER_PROFILES = {}  # (ip, port, path) -> (profile or None, expires)
+printer_profiles_lock = threading.Lock()
+
+# IPP wire format values (RFC 8010)
+IPP_GET_JOBS = 0x000A
+IPP_GET_PRINTER_ATTRIBUTES = 0x000B
+IPP_OPERATION_ATTRIBUTES_TAG = 0x01
+IPP_JOB_ATTRIBUTES_TAG = 0x02
+IPP_END_OF_ATTRIBUTES_TAG = 0x03
+IPP_INTEGER, IPP_BOOLEAN, IPP_ENUM = 0x21, 0x22, 0x23
+IPP_RESOLUTION, IPP_RANGE_OF_INTEGER = 0x32, 0x33
+IPP_KEYWORD, IPP_URI, IPP_CHARSET, IPP_NATURAL_LANGUAGE = 0x44, 0x45, 0x47, 0x48
+IPP_DOTS_PER_CM = 4
+
+def ipp_attribute(tag, name, value):
+    value = value.encode() if isinstance(value, str) else value
+    return struct.pack('>BH', tag, len(name)) + name.encode() + struct.pack('>H', len(value)) + value
+
+def build_ipp_request(operation, printer_uri, requested_attributes=(), extra_attributes=(), request_id=1):
+    """Encode an IPP/1.1 request with the standard operation attributes
+
+    extra_attributes is a list of (tag, name, encoded value) operation attributes.
+    """
+    body = struct.pack('>BBHI', 1, 1, operation, request_id) + bytes([IPP_OPERATION_ATTRIBUTES_TAG])
+    body += ipp_attribute(IPP_CHARSET, 'attributes-charset', 'utf-8')
+    body += ipp_attribute(IPP_NATURAL_LANGUAGE, 'attributes-natural-language', 'en')
+    body += ipp_attribute(IPP_URI, 'printer-uri', printer_uri)
+    for tag, name, value in extra_attributes:
+        body += ipp_attribute(tag, name, value)
+    for index, attribute in enumerate(requested_attributes):
+        # Additional values of a multi-valued attribute have an empty name
+        body += ipp_attribute(IPP_KEYWORD, 'requested-attributes' if index == 0 else '', attribute)
+    return body + bytes([IPP_END_OF_ATTRIBUTES_TAG])
+
+def decode_ipp_value(tag, raw):
+    if tag in (IPP_INTEGER, IPP_ENUM) and len(raw) == 4:
+        return struct.unpack('>i', raw)[0]
+    if tag == IPP_BOOLEAN:
+        return raw != b'\0'
+    if tag == IPP_RESOLUTION and len(raw) == 9:
+        return struct.unpack('>iib', raw)
+    if tag == IPP_RANGE_OF_INTEGER and len(raw) == 8:
+        return struct.unpack('>ii', raw)
+    if 0x40 <= tag <= 0x4F:
+        return raw.decode('utf-8', 'replace')
+    return raw
+
+def parse_ipp_response(data, by_group=False):
+    """Decode an IPP response into (status_code, {name: [values]}) across all groups
+
+    With by_group, the second item is a list of (group_tag, {name: [values]}) instead,
+    e.g. one job-attributes group per job.
+    """
+    _, status, _ = struct.unpack_from('>HHI', data, 0)
+    attributes = {}
+    groups = []
+    name = None
+    offset = 8
+    while offset < len(data):
+        tag = data[offset]
+        offset += 1
+        if tag == IPP_END_OF_ATTRIBUTES_TAG:
+            break
+        if tag < 0x10:
+            # Start of the next attribute group
+            if by_group:
+                attributes = {}
+                groups.append((tag, attributes))
+            continue
+        name_length, = struct.unpack_from('>H', data, offset)
+        offset += 2
+        if name_length:
+            name = data[offset:offset + name_length].decode('utf-8', 'replace')
+            offset += name_length
+        value_length, = struct.unpack_from('>H', data, offset)
+        offset += 2
+        attributes.setdefault(name, []).append(decode_ipp_value(tag, data[offset:offset + value_length]))
+        offset += value_length
+    return status, groups if by_group else attributes
+
+def ipp_request(printer_info, operation, requested_attributes=(), extra_attributes=(), by_group=False):
+    """Send an IPP request to the printer (or its CUPS queue) and return (status, attributes)"""
+    path = printer_info.get('ipp_path') or f"/printers/{printer_info['name']}"
+    printer_uri = f"ipp://{printer_info['ip']}:{printer_info['port']}{path}"
+    body = build_ipp_request(operation, printer_uri, requested_attributes, extra_attributes)
+    conn = http.client.HTTPConnection(printer_info['ip'], printer_info['port'], timeout=PROFILE_TIMEOUT)
+    try:
+        conn.request('POST', path, body, {'Content-Type': 'application/ipp'})
+        response = conn.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise ConnectionError(f"IPP request failed with HTTP {response.status}")
+        return parse_ipp_response(data, by_group)
+    finally:
+        conn.close()
+
+def resolution_dpi(resolution):
+    x, y, units = resolution
+    dpi = min(x, y)
+    return round(dpi * 2.54) if units == IPP_DOTS_PER_CM else dpi
+
+def fetch_printer_profile(printer_info):
+    """Ask the printer which formats, resolutions, media and duplex modes it supports"""
+    status, attributes = ipp_request(printer_info, IPP_GET_PRINTER_ATTRIBUTES, PROFILE_ATTRIBUTES)
+    if status >= 0x0400:
+        raise ConnectionError(f"Get-Printer-Attributes returned status 0x{status:04x}")
+    
+    resolutions = {resolution_dpi(r) for r in attributes.get('printer-resolution-supported', [])
+                   + attributes.get('pwg-raster-document-resolution-supported', []) if isinstance(r, tuple)}
+    for value in attributes.get('urf-supported', []):
+        # Apple raster lists resolutions as e.g. "RS300-600"
+        if value.startswith('RS'):
+            resolutions.update(int(dpi) for dpi in value[2:].split('-') if dpi.isdigit())
+    default = [r for r in attributes.get('printer-resolution-default', []) if isinstance(r, tuple)]
+    
+    return {
+        'formats': attributes.get('document-format-supported', []),
+        'resolutions': sorted(resolutions),
+        'default_dpi': resolution_dpi(default[0]) if default else max(resolutions, default=None),
+        'media': attributes.get('media-supported', []),
+        'media_default': (attributes.get('media-default') or [None])[0],
+        'duplex': any(side.startswith('two-sided') for side in attributes.get('sides-supported', []))
+    }
+
+@tracing.traced('capabilities')
+def get_printer_profile(printer_info):
+    """Return the cached capability profile for a printer, or None if it is unavailable"""
+    key = (printer_info['ip'], printer_info['port'], printer_info.get('ipp_path') or printer_info['name'])
+    with printer_profiles_lock:
+        profile, expires = PRINTER_PROFILES.get(key, (None, 0))
+        if time.monotonic() < expires:
+            return profile
+        try:
+            profile = fetch_printer_profile(printer_info)
+            logger.info(f"Printer {printer_info['name']} accepts {', '.join(profile['formats']) or 'no formats'} "
+                        f"at {profile['default_dpi'] or 'unknown'} dpi")
+            PRINTER_PROFILES[key] = (profile, time.monotonic() + PROFILE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not fetch capabilities for {printer_info['name']}: {e}")
+            profile = None
+            PRINTER_PROFILES[key] = (None, time.monotonic() + PROFILE_RETRY_TTL)
+        return profile
+
+# Chunked submission of large PDFs (CHUNK_PAGES = 0 disables it)
+CHUNK_PAGES = 0
+CHUNK_MIN_PAGES = 200
+CHUNK_RETRIES = 2
+CHUNK_PREFETCH = 2  # chunks prepared ahead of the one being submitted
+
+@tracing.traced('split_chunks')
+def write_pdf_chunks(document_path, page_count, chunk_pages, chunks, stop):
+    """Split a PDF into page-range files and queue them in order"""
+    try:
+        reader = PdfReader(document_path, strict=False)
+        stem = os.path.splitext(document_path)[0]
+        for index, start in enumerate(range(0, page_count, chunk_pages)):
+            if stop.is_set():
+                break
+            end = min(start + chunk_pages, page_count)
+            writer = PdfWriter()
+            for page_number in range(start, end):
+                writer.add_page(reader.pages[page_number])
+            chunk_path = f"{stem}.part{index + 1:04d}.pdf"
+            with open(chunk_path, 'wb') as f:
+                writer.write(f)
+            # Blocks while CHUNK_PREFETCH chunks are waiting to be submitted
+            chunks.put((index, start, end, chunk_path))
+    except Exception as e:
+        logger.exception(f"Error splitting {document_path} into chunks")
+        chunks.put(e)
+    finally:
+        chunks.put(None)
+
+def print_pdf_in_chunks(printer_info, document_path, page_count, chunk_pages=None):
+    """Print a large PDF as sequential page-range sub-jobs while later chunks are prepared"""
+    chunk_pages = chunk_pages or CHUNK_PAGES
+    total_chunks = (page_count + chunk_pages - 1) // chunk_pages
+    logger.info(f"Printing {document_path} ({page_count} pages) as {total_chunks} chunks of {chunk_pages} pages")
+    
+    chunks = queue.Queue(maxsize=CHUNK_PREFETCH)
+    stop = threading.Event()
+    # Run the splitter in a copy of this context so its span joins the job's trace
+    splitter = threading.Thread(target=contextvars.copy_context().run, name='pdf-chunker', daemon=True,
+                                args=(write_pdf_chunks, document_path, page_count, chunk_pages, chunks, stop))
+    splitter.start()
+    
+    progress = []
+    error = None
+    while True:
+        item = chunks.get()
+        if item is None:
+            break
+        if isinstance(item, Exception):
+            error = f"Could not split document: {str(item)}"
+            break
+        index, start, end, chunk_path = item
+        if not error and job_cancel_requested():
+            error = JOB_CANCELED_MESSAGE
+            stop.set()
+        if error:
+            # A previous chunk failed; discard whatever was already prepared
+            os.remove(chunk_path)
+            continue
+        
+        started = time.monotonic()
+        for attempt in range(1, CHUNK_RETRIES + 2):
+            success, message = print_to_airprint(printer_info, chunk_path)
+            if success:
+                break
+            if job_cancel_requested():
+                # Retrying a canceled chunk would only be refused again
+                message = JOB_CANCELED_MESSAGE
+                break
+            logger.warning(f"Chunk {index + 1}/{total_chunks} attempt {attempt} failed: {message}")
+        progress.append({'chunk': index + 1, 'pages': (start + 1, end), 'success': success,
+                         'attempts': attempt, 'seconds': time.monotonic() - started})
+        logger.info(f"Chunk {index + 1}/{total_chunks} (pages {start + 1}-{end}) "
+                    f"{'sent' if success else 'failed'}")
+        os.remove(chunk_path)
+        if not success:
+            error = (JOB_CANCELED_MESSAGE if message == JOB_CANCELED_MESSAGE else
+                     f"Chunk {index + 1}/{total_chunks} (pages {start + 1}-{end}) failed: {message}")
+            stop.set()
+    
+    splitter.join()
+    sent = sum(1 for chunk in progress if chunk['success'])
+    # The message is stored on the job, so each chunk's outcome shows up in the job status
+    report = format_chunk_progress(progress)
+    if error:
+        return False, f"{error} ({sent}/{total_chunks} chunks sent{': ' + report if report else ''})"
+    return True, f"Document sent to {printer_info['name']} in {total_chunks} chunks: {report}"
+
+def format_chunk_progress(progress):
+    """Describe each chunk's pages, outcome, attempts and time for the job's status message"""
+    parts = []
+    for chunk in progress:
+        retries = f" after {chunk['attempts']} attempts" if chunk['attempts'] > 1 else ''
+        parts.append(f"pages {chunk['pages'][0]}-{chunk['pages'][1]} {'sent' if chunk['success'] else 'failed'}"
+                     f"{retries} in {chunk['seconds']:.1f}s")
+    return '; '.join(parts)
+
+# Per-request pipeline: probing the printer and fetching its capabilities do not depend
+# on the document, so web requests start them when the headers arrive and overlap them
+# with the upload, inspection and duplicate check
+PIPELINE_WORKERS = 8
+pipeline_executor = None
+pipeline_executor_pid = None
+pipeline_executor_lock = threading.Lock()
+
+def run_in_pipeline(func, *args):
+    """Start func on the shared pipeline pool in a copy of the caller's context (and trace)"""
+    global pipeline_executor, pipeline_executor_pid
+    with pipeline_executor_lock:
+        if pipeline_executor_pid != os.getpid():
+            # Pool threads do not survive a fork into a gunicorn worker
+            pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix='pipeline')
+            pipeline_executor_pid = os.getpid()
+    return pipeline_executor.submit(contextvars.copy_context().run, func, *args)
+
+def start_printer_warmup(printer_info):
+    """Probe the printer and fetch its capability profile concurrently; returns (probe, profile) futures"""
+    probe = run_in_pipeline(test_printer_connection, printer_info, transport_port(printer_info))
+    profile = None
+    if printer_info.get('transport', 'cups') not in DIRECT_TRANSPORTS:
+        profile = run_in_pipeline(get_printer_profile, printer_info)
+    return probe, profile
+
+@tracing.traced('prepare')
+def prepare_document(document_path, printer_info, warmup):
+    """Convert a document for the printer once its profile is known; returns the path to print"""
+    probe, profile = warmup
+    can_connect, _ = probe.result()
+    if not can_connect:
+        return document_path
+    return convert_to_pdf_if_needed(document_path, profile.result() if profile else None)
+
+@tracing.traced('handle_document')
+def handle_document(document_path, printer_name=None, chunk_pages=None, job_id=None, warmup=None):
     """Handle document printing workflow"""
+    job_id = job_id or create_job(STATIC_PRINTER['name'], os.path.basename(document_path))
+    # Lets print_to_airprint attach CUPS job ids to this job
+    token = current_job_id.set(job_id)
+    try:
+        success, message = submit_document(document_path, chunk_pages, warmup)
+    except Exception as e:
+        finish_job_submission(job_id, False, str(e))
+        raise
+    finally:
+        current_job_id.reset(token)
+    finish_job_submission(job_id, success, message)
+    return success, message
+
+def submit_document(document_path, chunk_pages=None, warmup=None):
+    """Probe the printer (or use a warm-up already started), shrink the PDF if enabled and send it"""
     # Always use the static ngrok printer configuration
     selected_printer = STATIC_PRINTER
     logger.info(f"Using static printer: {selected_printer['name']}")
-    can_connect, message = test_printer_connection(selected_printer)
+    probe, _ = warmup or start_printer_warmup(selected_printer)
+    can_connect, message = probe.result()
     if not can_connect:
         return False, f"Failed to connect to printer: {message}"
+    if job_cancel_requested():
+        return False, JOB_CANCELED_MESSAGE
+    
+    optimized_path = document_path
+    if OPTIMIZE_PDF:
+        target_dpi = OPTIMIZE_TARGET_DPI
+        if selected_printer.get('transport', 'cups') not in DIRECT_TRANSPORTS:
+            profile = get_printer_profile(selected_printer)
+            if profile and profile['default_dpi']:
+                target_dpi = min(target_dpi, profile['default_dpi'])
+        optimized_path = optimize_pdf(document_path, target_dpi)
+    try:
+        return send_document(selected_printer, optimized_path, chunk_pages)
+    finally:
+        if optimized_path != document_path:
+            os.remove(optimized_path)
+
+def send_document(selected_printer, document_path, chunk_pages=None):
+    """Send a document to the printer, splitting large PDFs into chunks if configured"""
+    chunk_pages = CHUNK_PAGES if chunk_pages is None else chunk_pages
+    if chunk_pages:
+        document_info = inspect_document(document_path)
+        page_count = document_info['page_count'] or 0
+        if document_info['detected_type'] == 'pdf' and page_count >= max(CHUNK_MIN_PAGES, chunk_pages * 2):
+            return print_pdf_in_chunks(selected_printer, document_path, page_count, chunk_pages)
     return print_to_airprint(selected_printer, document_path)
 
 def verify_printer_setup():
@@ -323,8 +1490,623 @@ def verify_printer_setup():
         logger.exception("Error checking printer setup")
         return False, f"Error checking printer setup: {str(e)}"
 
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+
+# Hot-folder settings
+WATCH_WORKERS = 2
+WATCH_PROCESSING_DIR = '.processing'
+WATCH_DONE_DIR = 'done'
+WATCH_FAILED_DIR = 'failed'
+
+def inotify_watch(directory, mask):
+    """Create an inotify descriptor watching a directory (Linux only)"""
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    fd = libc.inotify_init1(IN_CLOEXEC)
+    if fd < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+    if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, f"inotify_add_watch failed for {directory}: {os.strerror(errno)}")
+    return fd
+
+def read_inotify_events(fd):
+    """Block until inotify events arrive and return them as (mask, name) pairs"""
+    data = os.read(fd, 64 * 1024)
+    events = []
+    offset = 0
+    while offset < len(data):
+        _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+        offset += INOTIFY_EVENT.size
+        name = data[offset:offset + length].rstrip(b'\0')
+        offset += length
+        events.append((mask, os.fsdecode(name)))
+    return events
+
+def unique_path(directory, filename):
+    """Return a path in directory for filename that does not clash with an existing file"""
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        return path
+    stem, ext = os.path.splitext(filename)
+    return os.path.join(directory, f"{stem}_{uuid.uuid4().hex[:8]}{ext}")
+
+def recover_claimed_files(watch_dir):
+    """Put files left in .processing by an interrupted run back into the hot folder"""
+    processing_dir = os.path.join(watch_dir, WATCH_PROCESSING_DIR)
+    for job_dir in os.scandir(processing_dir):
+        if not job_dir.is_dir():
+            continue
+        names = [entry.name for entry in os.scandir(job_dir.path) if entry.is_file()]
+        if names:
+            # Conversion output is always a longer .pdf name than the file it was made from
+            original_name = min(names, key=lambda n: (n.lower().endswith('.pdf'), len(n)))
+            os.rename(os.path.join(job_dir.path, original_name), unique_path(watch_dir, original_name))
+            logger.info(f"Hot folder: requeued {original_name} from an interrupted run")
+        shutil.rmtree(job_dir.path, ignore_errors=True)
+
+def print_watched_file(claimed_path, original_name, watch_dir, printer_name=None):
+    """Print one hot-folder file and move it to the done or failed folder"""
+    try:
+        with tracing.span('hotfolder', file=original_name):
+            success, message = handle_document(claimed_path, printer_name)
+    except Exception as e:
+        logger.exception(f"Error printing watched file {original_name}")
+        success, message = False, f"Error: {str(e)}"
+    
+    target_dir = os.path.join(watch_dir, WATCH_DONE_DIR if success else WATCH_FAILED_DIR)
+    shutil.move(claimed_path, unique_path(target_dir, original_name))
+    # The job directory only holds what handle_document wrote next to the file (converted PDFs)
+    shutil.rmtree(os.path.dirname(claimed_path), ignore_errors=True)
+    if success:
+        logger.info(f"Hot folder: printed {original_name}: {message}")
+    else:
+        logger.warning(f"Hot folder: failed to print {original_name}: {message}")
+    return success, message
+
+def watch_folder(watch_dir, printer_name=None, workers=WATCH_WORKERS):
+    """Print every file that is written or moved into watch_dir until interrupted"""
+    if platform.system() != 'Linux':
+        return False, "Folder watching requires Linux (inotify)"
+    
+    watch_dir = os.path.abspath(watch_dir)
+    processing_dir = os.path.join(watch_dir, WATCH_PROCESSING_DIR)
+    for sub_dir in (processing_dir, os.path.join(watch_dir, WATCH_DONE_DIR), os.path.join(watch_dir, WATCH_FAILED_DIR)):
+        os.makedirs(sub_dir, exist_ok=True)
+    
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hotfolder')
+    # Bound the backlog so a burst of files cannot pile up unbounded work in memory
+    slots = threading.BoundedSemaphore(workers * 2)
+    
+    def claim(name):
+        source_path = os.path.join(watch_dir, name)
+        # Skip dotfiles (editor/rsync temporaries) and our own subfolders
+        if not name or name.startswith('.') or not os.path.isfile(source_path):
+            return
+        slots.acquire()
+        # Move the file out of the watched directory before printing so that conversion
+        # output does not trigger new events. Each file gets its own directory so that
+        # report.jpg converting to report.pdf cannot overwrite a report.pdf dropped with it.
+        job_dir = os.path.join(processing_dir, uuid.uuid4().hex[:12])
+        os.mkdir(job_dir)
+        claimed_path = os.path.join(job_dir, name)
+        try:
+            os.rename(source_path, claimed_path)
+        except FileNotFoundError:
+            # Already claimed via a duplicate event
+            os.rmdir(job_dir)
+            slots.release()
+            return
+        logger.info(f"Hot folder: queued {name}")
+        
+        def finished(future):
+            slots.release()
+            if future.exception() is not None:
+                logger.error(f"Hot folder: error handling {name}; it remains in {job_dir}",
+                             exc_info=future.exception())
+        
+        executor.submit(print_watched_file, claimed_path, name, watch_dir, printer_name).add_done_callback(finished)
+    
+    def rescan():
+        for name in sorted(os.listdir(watch_dir)):
+            claim(name)
+    
+    fd = inotify_watch(watch_dir, IN_CLOSE_WRITE | IN_MOVED_TO)
+    logger.info(f"Watching {watch_dir} for documents to print ({workers} workers)")
+    try:
+        # Pick up anything dropped while we were not running or left half-done by a crash
+        recover_claimed_files(watch_dir)
+        rescan()
+        while True:
+            for mask, name in read_inotify_events(fd):
+                if mask & IN_Q_OVERFLOW:
+                    logger.warning("inotify queue overflowed, rescanning hot folder")
+                    rescan()
+                elif not mask & IN_ISDIR:
+                    claim(name)
+    except KeyboardInterrupt:
+        logger.info("Stopping hot folder watcher")
+    finally:
+        os.close(fd)
+        executor.shutdown(wait=True)
+    return True, "Hot folder watcher stopped"
+
+# Duplicate submission suppression, shared by all workers through SQLite
+DEDUP_DB = os.path.join(tempfile.gettempdir(), 'printit_dedup.sqlite3')
+IDEMPOTENCY_TTL = 24 * 3600  # how long an Idempotency-Key is remembered
+# Seconds; > 0 treats the same file sent to the same printer again as a duplicate
+DEDUP_WINDOW = int(os.environ.get('PRINTIT_DEDUP_WINDOW', '0'))
+DEDUP_MAX_ENTRIES = 10000
+DEDUP_WAIT = 20  # how long a duplicate waits for the original job; must stay under gunicorn's 30 s timeout
+DEDUP_RETRY_AFTER = 5  # seconds a duplicate that gave up waiting is told to wait before retrying
+DEDUP_PENDING_TIMEOUT = 600  # after this an unfinished claim is assumed abandoned
+
+def dedup_connection():
+    conn = sqlite3.connect(DEDUP_DB, timeout=30, isolation_level=None)
+    conn.execute("CREATE TABLE IF NOT EXISTS submissions "
+                 "(key TEXT PRIMARY KEY, created REAL, expires REAL, result TEXT)")
+    return conn
+
+def claim_submission(key, ttl):
+    """Claim key for a new job, or return the result of the job that already used it"""
+    deadline = time.time() + DEDUP_WAIT
+    while True:
+        conn = dedup_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            row = conn.execute('SELECT created, expires, result FROM submissions WHERE key = ?', (key,)).fetchone()
+            if row and row[1] > now and (row[2] is not None or now - row[0] < DEDUP_PENDING_TIMEOUT):
+                conn.execute('COMMIT')
+                if row[2] is not None:
+                    return json.loads(row[2])
+            else:
+                conn.execute('INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, NULL)', (key, now, now + ttl))
+                conn.execute('DELETE FROM submissions WHERE expires < ?', (now,))
+                conn.execute('DELETE FROM submissions WHERE key IN '
+                             '(SELECT key FROM submissions ORDER BY created DESC LIMIT -1 OFFSET ?)',
+                             (DEDUP_MAX_ENTRIES,))
+                conn.execute('COMMIT')
+                return None
+        finally:
+            conn.close()
+        
+        # The original job is still running; wait for its result
+        if time.time() > deadline:
+            return {'success': False, 'message': 'An identical print job is still in progress',
+                    'retry_after': DEDUP_RETRY_AFTER}
+        time.sleep(0.5)
+
+def complete_submission(key, result):
+    conn = dedup_connection()
+    try:
+        conn.execute('UPDATE submissions SET result = ? WHERE key = ?', (json.dumps(result), key))
+    finally:
+        conn.close()
+
+def release_submission(key):
+    conn = dedup_connection()
+    try:
+        conn.execute('DELETE FROM submissions WHERE key = ?', (key,))
+    finally:
+        conn.close()
+
+def run_deduplicated(keys, print_job):
+    """Run print_job() unless one of keys was already used; returns (result, is_duplicate)"""
+    claimed = []
+    try:
+        for key, ttl in keys:
+            result = claim_submission(key, ttl)
+            if result is not None:
+                logger.info(f"Duplicate submission ({key.split(':')[0]}), returning original result")
+                for owned_key in claimed:
+                    release_submission(owned_key)
+                return result, True
+            claimed.append(key)
+        result = print_job()
+    except Exception:
+        for key in claimed:
+            release_submission(key)
+        raise
+    
+    # Only successful jobs are remembered, so a failed print can simply be retried. The job token
+    # is left out: a replay may come from someone else, who must not be able to cancel the job
+    replay = {name: value for name, value in result.items() if name != 'job_token'}
+    for key in claimed:
+        if result['success']:
+            complete_submission(key, replay)
+        else:
+            release_submission(key)
+    return result, False
+
+# Print job registry and completion tracking, shared by all workers through SQLite
+JOBS_DB = os.path.join(tempfile.gettempdir(), 'printit_jobs.sqlite3')
+JOB_POLL_MIN_INTERVAL = 1.0  # seconds between printer polls right after a change
+JOB_POLL_MAX_INTERVAL = 30.0  # back-off limit while nothing changes
+JOB_IDLE_INTERVAL = 2.0  # how often to look for new jobs when none are outstanding
+JOB_TRACK_TIMEOUT = 24 * 3600  # give up on jobs the printer never reports as finished
+JOB_HISTORY_LIMIT = 1000
+IPP_JOB_STATES = {3: 'pending', 4: 'held', 5: 'processing', 6: 'stopped',
+                  7: 'canceled', 8: 'aborted', 9: 'completed'}
+FINISHED_JOB_STATES = ('canceled', 'aborted', 'completed')
+LP_REQUEST_ID = re.compile(r'request id is (\S+)-(\d+)')
+JOB_CANCELED_MESSAGE = 'Job was canceled'
+JOB_URGENT_PRIORITY = 100  # CUPS job-priority runs from 1 to 100; jobs default to 50
+IPP_CANCEL_JOB = 0x0008
+IPP_NAME = 0x42  # nameWithoutLanguage
+
+# Admin-only endpoints need "Authorization: Bearer <token>" and are disabled if this is unset.
+# Submitters can cancel their own jobs with the X-Job-Token returned when the job was accepted.
+ADMIN_TOKEN = os.environ.get('PRINTIT_ADMIN_TOKEN', '')
+
+current_job_id = contextvars.ContextVar('current_job_id', default=None)
+job_tracker_pid = None
+job_tracker_wakeup = threading.Event()
+
+def jobs_connection():
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, printer TEXT, document TEXT, "
+                 "state TEXT, message TEXT, created REAL, submitted REAL, finished REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS cups_jobs (printer TEXT, cups_job_id INTEGER, job_id TEXT, "
+                 "state TEXT, PRIMARY KEY (printer, cups_job_id))")
+    conn.execute("CREATE TABLE IF NOT EXISTS job_controls (job_id TEXT PRIMARY KEY, cancel_requested REAL, "
+                 "priority INTEGER)")
+    conn.execute("CREATE TABLE IF NOT EXISTS job_processes (job_id TEXT, pid INTEGER, PRIMARY KEY (job_id, pid))")
+    conn.execute("CREATE TABLE IF NOT EXISTS job_tokens (job_id TEXT PRIMARY KEY, token TEXT)")
+    return conn
+
+def create_job(printer_name, document_name):
+    """Register a new print job and return its id"""
+    job_id = uuid.uuid4().hex[:12]
+    conn = jobs_connection()
+    try:
+        conn.execute('INSERT INTO jobs (id, printer, document, state, created) VALUES (?, ?, ?, ?, ?)',
+                     (job_id, printer_name, document_name, 'received', time.time()))
+        for table in ('cups_jobs', 'job_controls', 'job_tokens'):
+            conn.execute(f'DELETE FROM {table} WHERE job_id IN (SELECT id FROM jobs ORDER BY created DESC '
+                         'LIMIT -1 OFFSET ?)', (JOB_HISTORY_LIMIT,))
+        conn.execute('DELETE FROM jobs WHERE id IN (SELECT id FROM jobs ORDER BY created DESC '
+                     'LIMIT -1 OFFSET ?)', (JOB_HISTORY_LIMIT,))
+    finally:
+        conn.close()
+    return job_id
+
+def record_lp_request_id(lp_output, printer_info):
+    """Attach the CUPS job id printed by lp ("request id is NAME-123") to the current job"""
+    match = LP_REQUEST_ID.search(lp_output or '')
+    job_id = current_job_id.get()
+    if not match or not job_id:
+        return
+    conn = jobs_connection()
+    try:
+        conn.execute('INSERT OR REPLACE INTO cups_jobs VALUES (?, ?, ?, ?)',
+                     (printer_info['name'], int(match.group(2)), job_id, 'submitted'))
+    finally:
+        conn.close()
+    logger.debug(f"Job {job_id} is CUPS job {match.group(0)[len('request id is '):]}")
+
+def finish_job_submission(job_id, success, message):
+    """Record the outcome of submitting a job and start tracking it if CUPS gave it an id"""
+    conn = jobs_connection()
+    try:
+        if job_cancel_requested(job_id):
+            # CUPS jobs created while the cancel request was being handled are stopped here
+            cancel_cups_jobs(conn, job_id)
+            conn.execute("UPDATE jobs SET state = 'canceled', message = ?, finished = ? WHERE id = ?",
+                         (JOB_CANCELED_MESSAGE, time.time(), job_id))
+            return
+        tracked = conn.execute('SELECT COUNT(*) FROM cups_jobs WHERE job_id = ?', (job_id,)).fetchone()[0]
+        # Jobs sent without a CUPS id (raw socket, LPD, helper script) cannot be followed further
+        state = ('submitted' if tracked else 'sent') if success else 'failed'
+        conn.execute('UPDATE jobs SET state = ?, message = ?, submitted = ?, finished = NULL WHERE id = ?',
+                     (state, message, time.time(), job_id))
+        if success and tracked:
+            # Chunks sent early may already have finished while later ones were being submitted
+            update_job_state(conn, job_id)
+    finally:
+        conn.close()
+    if success and tracked:
+        ensure_job_tracker()
+        job_tracker_wakeup.set()
+
+def get_job(job_id):
+    """Return a job's status, completion latency and CUPS sub-jobs, or None"""
+    conn = jobs_connection()
+    try:
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        cups_jobs = conn.execute('SELECT cups_job_id, state FROM cups_jobs WHERE job_id = ? ORDER BY cups_job_id',
+                                 (job_id,)).fetchall()
+        control = conn.execute('SELECT priority FROM job_controls WHERE job_id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    job = dict(row)
+    job['priority'] = control['priority'] if control else None
+    job['cups_jobs'] = [{'id': c['cups_job_id'], 'state': c['state']} for c in cups_jobs]
+    job['latency'] = round(job['finished'] - job['submitted'], 3) if job['finished'] and job['submitted'] else None
+    return job
+
+def list_jobs(limit=50):
+    conn = jobs_connection()
+    try:
+        ids = [row['id'] for row in conn.execute('SELECT id FROM jobs ORDER BY created DESC LIMIT ?', (limit,))]
+    finally:
+        conn.close()
+    return [get_job(job_id) for job_id in ids]
+
+def issue_job_token(job_id):
+    """Create the secret that lets a job's submitter cancel it without admin rights"""
+    token = secrets.token_urlsafe(16)
+    conn = jobs_connection()
+    try:
+        conn.execute('INSERT OR REPLACE INTO job_tokens VALUES (?, ?)', (job_id, token))
+    finally:
+        conn.close()
+    return token
+
+def job_token_valid(job_id, token):
+    conn = jobs_connection()
+    try:
+        row = conn.execute('SELECT token FROM job_tokens WHERE job_id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return bool(row and token) and hmac.compare_digest(row['token'], token)
+
+def job_control(job_id, column):
+    conn = jobs_connection()
+    try:
+        row = conn.execute(f'SELECT {column} FROM job_controls WHERE job_id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+def job_cancel_requested(job_id=None):
+    """Return True if the given (or current) job has been asked to stop"""
+    job_id = job_id or current_job_id.get()
+    return bool(job_id) and job_control(job_id, 'cancel_requested') is not None
+
+def job_priority(job_id=None):
+    """Return the priority an admin gave the given (or current) job, or None"""
+    job_id = job_id or current_job_id.get()
+    return job_control(job_id, 'priority') if job_id else None
+
+def set_job_control(conn, job_id, column, value):
+    conn.execute('INSERT OR IGNORE INTO job_controls (job_id) VALUES (?)', (job_id,))
+    conn.execute(f'UPDATE job_controls SET {column} = ? WHERE job_id = ?', (value, job_id))
+
+def kill_job_processes(pids):
+    for pid in pids:
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(pid, signal.SIGTERM)
+            else:
+                os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass  # already exited
+
+def cancel_cups_job(printer_name, cups_job_id):
+    """Cancel one CUPS job with IPP Cancel-Job, falling back to the cancel command"""
+    if printer_name == STATIC_PRINTER['name']:
+        try:
+            status, _ = ipp_request(STATIC_PRINTER, IPP_CANCEL_JOB, extra_attributes=[
+                (IPP_INTEGER, 'job-id', struct.pack('>i', cups_job_id)),
+                (IPP_NAME, 'requesting-user-name', getpass.getuser())])
+            if status < 0x0400:
+                return True
+            logger.debug(f"Cancel-Job for {printer_name}-{cups_job_id} returned status 0x{status:04x}")
+        except Exception as e:
+            logger.debug(f"IPP Cancel-Job failed for {printer_name}-{cups_job_id} ({e}), falling back to cancel")
+    try:
+        result = subprocess.run(['cancel', f"{printer_name}-{cups_job_id}"], capture_output=True, text=True,
+                                timeout=30)
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"Could not cancel {printer_name}-{cups_job_id}: {e}")
+        return False
+    if result.returncode:
+        logger.warning(f"Could not cancel {printer_name}-{cups_job_id}: {result.stderr.strip()}")
+    return result.returncode == 0
+
+def cancel_cups_jobs(conn, job_id):
+    """Cancel a job's unfinished CUPS jobs; returns how many could not be cancelled"""
+    rows = conn.execute(f"SELECT printer, cups_job_id FROM cups_jobs WHERE job_id = ? AND state NOT IN "
+                        f"({', '.join('?' * len(FINISHED_JOB_STATES))})", (job_id,) + FINISHED_JOB_STATES).fetchall()
+    failed = 0
+    for row in rows:
+        if cancel_cups_job(row['printer'], row['cups_job_id']):
+            conn.execute("UPDATE cups_jobs SET state = 'canceled' WHERE printer = ? AND cups_job_id = ?",
+                         (row['printer'], row['cups_job_id']))
+        else:
+            failed += 1
+    return failed
+
+def cancel_job(job_id):
+    """Stop a job at whatever stage it has reached; returns (success, message)"""
+    conn = jobs_connection()
+    try:
+        state = conn.execute('SELECT state FROM jobs WHERE id = ?', (job_id,)).fetchone()['state']
+        if state in FINISHED_JOB_STATES + ('failed', 'unknown'):
+            return False, f"Job is already {state}"
+        if state == 'sent':
+            return False, "Job was sent straight to the printer and cannot be canceled"
+        
+        # Every stage of the submitting worker checks this flag, whichever process it runs in
+        set_job_control(conn, job_id, 'cancel_requested', time.time())
+        pids = [row['pid'] for row in conn.execute('SELECT pid FROM job_processes WHERE job_id = ?', (job_id,))]
+        kill_job_processes(pids)
+        
+        if state in ('received', 'canceling'):
+            # The submitting worker records the final state when it stops
+            conn.execute("UPDATE jobs SET state = 'canceling' WHERE id = ?", (job_id,))
+            logger.info(f"Job {job_id} will stop before reaching the printer ({len(pids)} processes killed)")
+            return True, "Job is being canceled"
+        
+        failed = cancel_cups_jobs(conn, job_id)
+        if failed:
+            # Leave the state to the tracker; the parts that could not be canceled may still print
+            return False, f"{failed} queued part(s) of the job could not be canceled"
+        update_job_state(conn, job_id)
+        return True, "Job canceled"
+    finally:
+        conn.close()
+
+def prioritize_job(job_id, priority=JOB_URGENT_PRIORITY):
+    """Move a job ahead of other queued work; returns (success, message)"""
+    conn = jobs_connection()
+    try:
+        state = conn.execute('SELECT state FROM jobs WHERE id = ?', (job_id,)).fetchone()['state']
+        if state in FINISHED_JOB_STATES + ('failed', 'unknown', 'sent', 'canceling'):
+            return False, f"Job is {state} and can no longer be reprioritized"
+        # Parts submitted from now on pick this up through lp -q
+        set_job_control(conn, job_id, 'priority', priority)
+        rows = conn.execute(f"SELECT printer, cups_job_id FROM cups_jobs WHERE job_id = ? AND state NOT IN "
+                            f"({', '.join('?' * len(FINISHED_JOB_STATES))})",
+                            (job_id,) + FINISHED_JOB_STATES).fetchall()
+    finally:
+        conn.close()
+    
+    failed = 0
+    for row in rows:
+        try:
+            result = run_command(['lp', '-i', f"{row['printer']}-{row['cups_job_id']}", '-q', str(priority)],
+                                 capture_output=True, text=True, timeout=30)
+            if result.returncode:
+                raise subprocess.SubprocessError(result.stderr.strip())
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.warning(f"Could not reprioritize {row['printer']}-{row['cups_job_id']}: {e}")
+            failed += 1
+    if failed:
+        return False, f"{failed} queued part(s) of the job could not be reprioritized"
+    logger.info(f"Job {job_id} raised to priority {priority}")
+    return True, f"Job priority set to {priority}"
+
+def query_printer_job_states(printer_info, cups_job_ids):
+    """Return {cups_job_id: state} for outstanding jobs using one or two batched requests"""
+    try:
+        states = {}
+        for which in ('not-completed', 'completed'):
+            status, groups = ipp_request(printer_info, IPP_GET_JOBS, ['job-id', 'job-state'],
+                                         [(IPP_KEYWORD, 'which-jobs', which)], by_group=True)
+            if status >= 0x0400:
+                raise ConnectionError(f"Get-Jobs returned status 0x{status:04x}")
+            for tag, attributes in groups:
+                if tag == IPP_JOB_ATTRIBUTES_TAG and 'job-id' in attributes and 'job-state' in attributes:
+                    states[attributes['job-id'][0]] = IPP_JOB_STATES.get(attributes['job-state'][0], 'unknown')
+            if which == 'not-completed' and all(job_id in states for job_id in cups_job_ids):
+                break  # nothing has finished, so the completed list is not needed
+        # Jobs CUPS no longer knows about have been purged from its history after finishing
+        return {job_id: states.get(job_id, 'completed') for job_id in cups_job_ids}
+    except Exception as e:
+        logger.debug(f"IPP Get-Jobs failed for {printer_info['name']} ({e}), falling back to lpstat")
+    
+    # lpstat -o lists only jobs that have not finished yet
+    result = subprocess.run(['lpstat', '-o', printer_info['name']], capture_output=True, text=True, timeout=30)
+    prefix = printer_info['name'] + '-'
+    active = {int(line.split()[0][len(prefix):]) for line in result.stdout.splitlines()
+              if line.startswith(prefix) and line.split()[0][len(prefix):].isdigit()}
+    return {job_id: 'processing' if job_id in active else 'completed' for job_id in cups_job_ids}
+
+def poll_outstanding_jobs():
+    """Update every unfinished CUPS job with one query per printer; returns (outstanding, changed)"""
+    conn = jobs_connection()
+    try:
+        done_states = FINISHED_JOB_STATES + ('unknown',)
+        rows = conn.execute("SELECT printer, cups_job_id, job_id, state FROM cups_jobs WHERE state NOT IN "
+                            f"({', '.join('?' * len(done_states))})", done_states).fetchall()
+        by_printer = {}
+        for row in rows:
+            by_printer.setdefault(row['printer'], []).append(row)
+        
+        changed_jobs = set()
+        for printer_name, printer_rows in by_printer.items():
+            if printer_name != STATIC_PRINTER['name']:
+                continue
+            printer_info = STATIC_PRINTER
+            try:
+                states = query_printer_job_states(printer_info, [row['cups_job_id'] for row in printer_rows])
+            except Exception as e:
+                logger.warning(f"Could not poll jobs on {printer_name}: {e}")
+                continue
+            for row in printer_rows:
+                state = states[row['cups_job_id']]
+                if state != row['state']:
+                    conn.execute('UPDATE cups_jobs SET state = ? WHERE printer = ? AND cups_job_id = ?',
+                                 (state, printer_name, row['cups_job_id']))
+                    changed_jobs.add(row['job_id'])
+        
+        for job_id in changed_jobs:
+            update_job_state(conn, job_id)
+        
+        # Stop following jobs the printer never reports as finished
+        conn.execute("UPDATE jobs SET state = 'unknown', message = 'Printer never reported completion' "
+                     "WHERE state IN ('submitted', 'pending', 'held', 'processing', 'stopped') AND submitted < ?",
+                     (time.time() - JOB_TRACK_TIMEOUT,))
+        conn.execute("UPDATE cups_jobs SET state = 'unknown' WHERE job_id IN "
+                     "(SELECT id FROM jobs WHERE state = 'unknown')")
+        return len(rows), len(changed_jobs)
+    finally:
+        conn.close()
+
+def update_job_state(conn, job_id):
+    """Derive a job's state from its CUPS sub-jobs and record completion time"""
+    row = conn.execute('SELECT state FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None or row['state'] in ('received', 'canceling', 'sent', 'failed', 'unknown'):
+        # Still being submitted (finish_job_submission records the outcome) or no longer followed
+        return
+    states = [row['state'] for row in conn.execute('SELECT state FROM cups_jobs WHERE job_id = ?', (job_id,))]
+    if not states:
+        return
+    active = [state for state in states if state not in FINISHED_JOB_STATES]
+    if active:
+        # Sub-jobs CUPS has not reported on yet are still 'submitted'
+        state = next((s for s in ('stopped', 'held', 'processing', 'pending') if s in active), 'submitted')
+    else:
+        state = next((s for s in ('aborted', 'canceled') if s in states), 'completed')
+    finished = time.time() if state in FINISHED_JOB_STATES else None
+    conn.execute('UPDATE jobs SET state = ?, finished = ? WHERE id = ?', (state, finished, job_id))
+    logger.info(f"Job {job_id} is now {state}")
+
+def ensure_job_tracker():
+    """Start the completion tracker thread once per process"""
+    global job_tracker_pid
+    if job_tracker_pid != os.getpid():
+        job_tracker_pid = os.getpid()
+        threading.Thread(target=track_jobs, name='job-tracker', daemon=True).start()
+
+def track_jobs():
+    """Poll outstanding jobs on an adaptive interval for as long as the process runs"""
+    if fcntl:
+        # Only one worker process polls; the others block here without using CPU
+        lock_file = open(JOBS_DB + '.lock', 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    interval = JOB_POLL_MIN_INTERVAL
+    while True:
+        try:
+            outstanding, changed = poll_outstanding_jobs()
+        except Exception:
+            logger.exception("Error polling print jobs")
+            outstanding, changed = 1, 0
+        if not outstanding:
+            wait = JOB_IDLE_INTERVAL
+            interval = JOB_POLL_MIN_INTERVAL
+        else:
+            # Poll quickly while jobs are moving, back off while they sit in the queue
+            interval = JOB_POLL_MIN_INTERVAL if changed else min(interval * 2, JOB_POLL_MAX_INTERVAL)
+            wait = interval
+        job_tracker_wakeup.wait(wait)
+        job_tracker_wakeup.clear()
+
 # Fix the main function to properly use argparse
 def main():
+    global CHUNK_PAGES, OPTIMIZE_PDF, OPTIMIZE_TARGET_DPI, DEDUP_WINDOW
     import argparse
     # Create the parser object first
     parser = argparse.ArgumentParser(description='Print documents to AirPrint printers')
@@ -332,10 +2114,28 @@ def main():
     parser.add_argument('--printer', help='Name of the printer to use')
     parser.add_argument('--web', action='store_true', help='Start the web application')
     parser.add_argument('--port', type=int, default=8000, help='Web application port')
+    parser.add_argument('--watch', metavar='DIR', help='Print files dropped into DIR (Linux only)')
+    parser.add_argument('--workers', type=int, default=WATCH_WORKERS, help='Concurrent print jobs in --watch mode')
+    parser.add_argument('--chunk-pages', type=int, default=None,
+                        help=f'Submit PDFs of {CHUNK_MIN_PAGES}+ pages as sub-jobs of this many pages')
+    parser.add_argument('--optimize-pdf', type=int, nargs='?', const=OPTIMIZE_TARGET_DPI, default=None,
+                        metavar='DPI', help=f'Shrink PDFs before sending, downsampling images above DPI '
+                                            f'(default {OPTIMIZE_TARGET_DPI})')
+    parser.add_argument('--dedup-window', type=int, default=None, metavar='SECONDS',
+                        help='Treat the same file sent to the same printer within SECONDS as a duplicate '
+                             '(also PRINTIT_DEDUP_WINDOW)')
     
     # Parse arguments
     args = parser.parse_args()
     
+    if args.chunk_pages is not None:
+        CHUNK_PAGES = args.chunk_pages
+    if args.optimize_pdf is not None:
+        OPTIMIZE_PDF = True
+        OPTIMIZE_TARGET_DPI = args.optimize_pdf
+    if args.dedup_window is not None:
+        DEDUP_WINDOW = args.dedup_window
+    
     # Rest of the function remains the same
     if args.web:
         print_status, msg = verify_printer_setup()
@@ -348,11 +2148,19 @@ def main():
         app = create_app()
         print(f"Starting web application on port {args.port}...")
         app.run(host='0.0.0.0', port=args.port, debug=True)
+    elif args.watch:
+        if not os.path.isdir(args.watch):
+            print(f"Watch directory not found: {args.watch}")
+            return
+        success, msg = watch_folder(args.watch, args.printer, args.workers)
+        if not success:
+            print(msg)
     elif args.document:
         if not os.path.exists(args.document):
             print(f"Document not found: {args.document}")
             return
-        handle_document(args.document, args.printer)
+        with tracing.span('cli', document=args.document):
+            handle_document(args.document, args.printer)
     else:
         parser.print_help()
 
@@ -363,9 +2171,62 @@ def create_app():
     upload_dir = os.path.join(tempfile.gettempdir(), 'printit_uploads')
     os.makedirs(upload_dir, exist_ok=True)
     
+    @app.before_request
+    def start_request_trace():
+        # Honour a caller-supplied correlation ID so traces can be joined up across systems
+        trace_id = tracing.valid_trace_id(request.headers.get('X-Request-ID'))
+        g.trace_span = tracing.start_span(f"{request.method} {request.path}", trace_id=trace_id or tracing.new_trace_id())
+    
+    @app.before_request
+    def warm_up_printer():
+        # Runs before the body is read, so the probe overlaps with the upload itself
+        if request.method == 'POST' and request.path in ('/upload', '/print_direct'):
+            g.printer_warmup = start_printer_warmup(STATIC_PRINTER)
+    
+    @app.after_request
+    def add_trace_header(response):
+        if 'trace_span' in g:
+            response.headers['X-Request-ID'] = g.trace_span[0]['trace']
+        return response
+    
+    @app.teardown_request
+    def end_request_trace(error):
+        if 'trace_span' in g:
+            tracing.end_span(g.pop('trace_span'), error)
+    
+    def submission_keys(content_hash, printer_name):
+        """Deduplication keys for this request as (key, ttl) pairs"""
+        keys = []
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            keys.append(('key:' + idempotency_key[:255], IDEMPOTENCY_TTL))
+        if DEDUP_WINDOW > 0:
+            content_key = hashlib.sha256(f"{content_hash}|{printer_name}".encode()).hexdigest()
+            keys.append(('content:' + content_key, DEDUP_WINDOW))
+        return keys
+    
+    def is_admin():
+        authorization = request.headers.get('Authorization', '')
+        return bool(ADMIN_TOKEN) and hmac.compare_digest(authorization, f"Bearer {ADMIN_TOKEN}")
+    
+    def job_response(result, duplicate):
+        if not duplicate:
+            return jsonify(result)
+        if 'retry_after' in result:
+            # The original job is still running, so there is no result to replay yet
+            response = jsonify(result)
+            response.status_code = 409
+            response.headers['Retry-After'] = str(result['retry_after'])
+            return response
+        response = jsonify(dict(result, duplicate=True))
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    
     @app.route('/')
     def home():
-        return render_template('index.html', static_printer=STATIC_PRINTER)
+        profile = get_printer_profile(STATIC_PRINTER)
+        return render_template('index.html', static_printer=STATIC_PRINTER,
+                               client_image_dpi=(profile and profile['default_dpi']) or CLIENT_IMAGE_DEFAULT_DPI)
     
     @app.route('/discover_printers')
     def discover_printers_route():
@@ -379,10 +2240,12 @@ def create_app():
     
     @app.route('/upload', methods=['POST'])
     def upload_file():
-        if 'file' not in request.files:
+        with tracing.span('parse_upload'):
+            files = request.files
+        if 'file' not in files:
             return jsonify({'success': False, 'message': 'No file part'})
         
-        file = request.files['file']
+        file = files['file']
         if file.filename == '':
             return jsonify({'success': False, 'message': 'No selected file'})
         
@@ -395,7 +2258,8 @@ def create_app():
                 
                 filename = str(uuid.uuid4()) + ext
                 filepath = os.path.join(upload_dir, filename)
-                file.save(filepath)
+                with tracing.span('save_upload'):
+                    content_hash = save_and_hash(file.stream, filepath)
                 logger.debug(f"File saved to {filepath}")
                 
                 # Check file size
@@ -404,14 +2268,12 @@ def create_app():
                 if file_size == 0:
                     return jsonify({'success': False, 'message': 'Uploaded file is empty'})
                 
-                # Check if file is readable
-                try:
-                    with open(filepath, 'rb') as f:
-                        f.read(1024)  # Try to read first 1KB
-                    logger.debug("File is readable")
-                except Exception as e:
-                    logger.error(f"File is not readable: {str(e)}")
-                    return jsonify({'success': False, 'message': f'Uploaded file is not readable: {str(e)}'})
+                warmup = g.printer_warmup
+                
+                # Reuses any metadata cached by an earlier /inspect of the same file
+                document_info = inspect_document(filepath, content_hash)
+                if not document_info['printable']:
+                    return jsonify({'success': False, 'message': f"File cannot be printed: {document_info['reason']}"})
                 
                 printer_name = request.form.get('printer')
                 if not printer_name:
@@ -419,25 +2281,35 @@ def create_app():
                     printer_name = STATIC_PRINTER['name']
                 
                 # Enhanced log message
-                logger.info(f"Starting print job: File={filename} ({file_size} bytes), Printer={printer_name}")
-                
-                success, message = handle_document(filepath, printer_name)
+                logger.info(f"Starting print job: File={filename} ({file_size} bytes, "
+                            f"{document_info['page_count'] or '?'} pages), Printer={printer_name}")
                 
-                if success:
-                    logger.info(f"Successfully printed {filename} to {printer_name}")
-                    return jsonify({'success': True, 'message': message})
-                else:
-                    logger.warning(f"Print job failed: {message}")
-                    return jsonify({
-                        'success': False, 
-                        'message': message,
-                        'details': {
-                            'file_name': file.filename,
-                            'saved_as': filename,
-                            'file_size': file_size,
-                            'mime_type': get_file_type(filepath)
+                def print_job():
+                    job_id = create_job(printer_name, file.filename)
+                    # Converted only once the duplicate check has passed, so replays cost nothing
+                    document_path = prepare_document(filepath, STATIC_PRINTER, warmup)
+                    success, message = handle_document(document_path, printer_name, job_id=job_id, warmup=warmup)
+                    
+                    if success:
+                        logger.info(f"Successfully printed {filename} to {printer_name}")
+                        return {'success': True, 'message': message, 'job_id': job_id,
+                                'job_token': issue_job_token(job_id)}
+                    else:
+                        logger.warning(f"Print job failed: {message}")
+                        return {
+                            'success': False, 
+                            'message': message,
+                            'job_id': job_id,
+                            'details': {
+                                'file_name': file.filename,
+                                'saved_as': filename,
+                                'file_size': file_size,
+                                'mime_type': get_file_type(filepath)
+                            }
                         }
-                    })
+                
+                keys = submission_keys(document_info['content_hash'], printer_name)
+                return job_response(*run_deduplicated(keys, print_job))
             except Exception as e:
                 error_msg = f"Error processing upload: {str(e)}"
                 logger.exception(error_msg)
@@ -446,10 +2318,12 @@ def create_app():
     @app.route('/print_direct', methods=['POST'])
     def print_direct():
         """Print directly using the static printer"""
-        if 'file' not in request.files:
+        with tracing.span('parse_upload'):
+            files = request.files
+        if 'file' not in files:
             return jsonify({'success': False, 'message': 'No file part'})
         
-        file = request.files['file']
+        file = files['file']
         if file.filename == '':
             return jsonify({'success': False, 'message': 'No selected file'})
         
@@ -461,7 +2335,8 @@ def create_app():
             
             filename = str(uuid.uuid4()) + ext
             filepath = os.path.join(upload_dir, filename)
-            file.save(filepath)
+            with tracing.span('save_upload'):
+                content_hash = save_and_hash(file.stream, filepath)
             logger.debug(f"File saved to {filepath}")
             
             # Check file size
@@ -469,19 +2344,101 @@ def create_app():
             if file_size == 0:
                 return jsonify({'success': False, 'message': 'Uploaded file is empty'})
             
+            warmup = g.printer_warmup
+            
+            document_info = inspect_document(filepath, content_hash)
+            if not document_info['printable']:
+                return jsonify({'success': False, 'message': f"File cannot be printed: {document_info['reason']}"})
+            
             # Print directly to static printer
             logger.info(f"Direct printing job: File={filename}, Size={file_size} bytes")
-            success, message = handle_document(filepath)
             
-            if success:
-                return jsonify({'success': True, 'message': f"Document sent to {STATIC_PRINTER['name']}"})
-            else:
-                return jsonify({'success': False, 'message': message})
+            def print_job():
+                job_id = create_job(STATIC_PRINTER['name'], file.filename)
+                # Converted only once the duplicate check has passed, so replays cost nothing
+                document_path = prepare_document(filepath, STATIC_PRINTER, warmup)
+                success, message = handle_document(document_path, job_id=job_id, warmup=warmup)
+                
+                if success:
+                    return {'success': True, 'message': f"Document sent to {STATIC_PRINTER['name']}", 'job_id': job_id,
+                            'job_token': issue_job_token(job_id)}
+                else:
+                    return {'success': False, 'message': message, 'job_id': job_id}
+            
+            keys = submission_keys(document_info['content_hash'], STATIC_PRINTER['name'])
+            return job_response(*run_deduplicated(keys, print_job))
         except Exception as e:
             error_msg = f"Error processing direct print: {str(e)}"
             logger.exception(error_msg)
             return jsonify({'success': False, 'message': error_msg})
     
+    @app.route('/inspect', methods=['POST'])
+    def inspect():
+        """Report document metadata without printing"""
+        with tracing.span('parse_upload'):
+            files = request.files
+        if 'file' not in files:
+            return jsonify({'success': False, 'message': 'No file part'})
+        
+        file = files['file']
+        if file.filename == '':
+            return jsonify({'success': False, 'message': 'No selected file'})
+        
+        _, ext = os.path.splitext(file.filename)
+        filepath = os.path.join(upload_dir, f"inspect_{uuid.uuid4()}{ext or '.tmp'}")
+        try:
+            with tracing.span('save_upload'):
+                content_hash = save_and_hash(file.stream, filepath)
+            document_info = inspect_document(filepath, content_hash)
+            return jsonify({'success': True, 'file_name': file.filename, 'document': document_info})
+        except Exception as e:
+            error_msg = f"Error inspecting file: {str(e)}"
+            logger.exception(error_msg)
+            return jsonify({'success': False, 'message': error_msg})
+        finally:
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+    
+    @app.route('/jobs')
+    def jobs_route():
+        """Admin only: the job list would let anyone find other users' jobs"""
+        if not is_admin():
+            return jsonify({'success': False, 'message': 'Admin authorization required'}), 403
+        limit = request.args.get('limit', 50, type=int)
+        return jsonify({'success': True, 'jobs': list_jobs(limit)})
+    
+    @app.route('/jobs/<job_id>')
+    def job_status(job_id):
+        job = get_job(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': f"Job '{job_id}' not found"}), 404
+        return jsonify({'success': True, 'job': job})
+    
+    @app.route('/jobs/<job_id>', methods=['DELETE'])
+    def cancel_job_route(job_id):
+        """Cancel a job; needs its X-Job-Token, or admin rights for anyone's job"""
+        if not is_admin() and not job_token_valid(job_id, request.headers.get('X-Job-Token', '')):
+            return jsonify({'success': False, 'message': 'Job token or admin authorization required'}), 403
+        if get_job(job_id) is None:
+            return jsonify({'success': False, 'message': f"Job '{job_id}' not found"}), 404
+        success, message = cancel_job(job_id)
+        return jsonify({'success': success, 'message': message, 'job': get_job(job_id)}), 200 if success else 409
+    
+    @app.route('/jobs/<job_id>/priority', methods=['POST'])
+    def job_priority_route(job_id):
+        """Admin only: put a job ahead of other queued work"""
+        if not is_admin():
+            return jsonify({'success': False, 'message': 'Admin authorization required'}), 403
+        if get_job(job_id) is None:
+            return jsonify({'success': False, 'message': f"Job '{job_id}' not found"}), 404
+        priority = (request.get_json(silent=True) or {}).get('priority', JOB_URGENT_PRIORITY)
+        if not isinstance(priority, int) or not 1 <= priority <= 100:
+            return jsonify({'success': False, 'message': 'priority must be an integer from 1 to 100'}), 400
+        success, message = prioritize_job(job_id, priority)
+        return jsonify({'success': success, 'message': message, 'job': get_job(job_id)}), 200 if success else 409
+    
     @app.route('/test_printer/<printer_name>')
     def test_printer(printer_name):
         printers = discover_airprint_printers()
@@ -558,6 +2515,11 @@ def create_app():
         .tab-button.active { border-bottom: 2px solid #4CAF50; font-weight: bold; }
         .tab-panel { display: none; }
         .tab-panel.active { display: block; }
+        .checkbox-label { display: flex; align-items: center; gap: 8px; font-weight: normal; }
+        #uploadProgress { display: none; align-items: center; gap: 10px; margin-top: 20px; }
+        #uploadProgress progress { flex-grow: 1; height: 16px; }
+        .cancel-button { background-color: #f44336; }
+        .cancel-button:hover { background-color: #d32f2f; }
     </style>
 </head>
 <body>
@@ -617,6 +2579,17 @@ def create_app():
                 <button type="submit">Print Document</button>
             </form>
         </div>
+        <div class="form-group">
+            <label class="checkbox-label">
+                <input type="checkbox" id="optimizeImages" checked>
+                Shrink large photos before uploading (faster, same print quality)
+            </label>
+        </div>
+        <div id="uploadProgress">
+            <progress id="uploadProgressBar" max="100" value="0"></progress>
+            <span id="uploadProgressText">0%</span>
+            <button type="button" id="cancelUpload" class="cancel-button">Cancel</button>
+        </div>
         <div id="message"></div>
         <div style="margin-top: 20px; font-size: 0.9em; color: #666;">
             <p><strong>Troubleshooting:</strong></p>
@@ -630,6 +2603,16 @@ def create_app():
     </div>
 
     <script>
+        // Images are resized to fit a letter page at the printer's resolution before upload
+        const CLIENT_IMAGE_DPI = {{ client_image_dpi }};
+        const PAGE_INCHES = [8.5, 11];
+        // Formats the browser can decode and that survive re-encoding as JPEG
+        const RESIZABLE_TYPES = ['image/jpeg', 'image/png', 'image/webp', 'image/bmp'];
+        let currentUpload = null;
+        let submitting = false;
+        // One Idempotency-Key per form submission, reused when it is retried
+        const idempotencyKeys = {};
+
         document.addEventListener('DOMContentLoaded', function() {
             // Tab functionality
             const tabButtons = document.querySelectorAll('.tab-button');
@@ -651,6 +2634,26 @@ def create_app():
             testDefaultPrinterConnection();
             document.getElementById('testDefaultPrinter').addEventListener('click', testDefaultPrinterConnection);
             
+            // Remember the image optimisation preference
+            const optimizeImages = document.getElementById('optimizeImages');
+            optimizeImages.checked = localStorage.getItem('optimizeImages') !== 'false';
+            optimizeImages.addEventListener('change', function() {
+                localStorage.setItem('optimizeImages', this.checked);
+            });
+            
+            document.getElementById('cancelUpload').addEventListener('click', function() {
+                if (currentUpload) {
+                    currentUpload.abort();
+                }
+            });
+            
+            // A different file or printer makes it a new submission
+            ['quickPrintForm', 'advancedPrintForm'].forEach(formId => {
+                document.getElementById(formId).addEventListener('change', function() {
+                    delete idempotencyKeys[formId];
+                });
+            });
+            
             // Quick print form
             document.getElementById('quickPrintForm').addEventListener('submit', function(e) {
                 e.preventDefault();
@@ -663,26 +2666,7 @@ def create_app():
                     return;
                 }
                 
-                formData.append('file', fileInput.files[0]);
-                
-                showMessage('Uploading and printing...', 'info');
-                
-                fetch('/print_direct', {
-                    method: 'POST',
-                    body: formData
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success) {
-                        showMessage(data.message, 'success');
-                        document.getElementById('quickPrintForm').reset();
-                    } else {
-                        showMessage('Print job failed: ' + data.message, 'error');
-                    }
-                })
-                .catch(error => {
-                    showMessage('Error: ' + error, 'error');
-                });
+                submitPrintJob('/print_direct', fileInput.files[0], formData, 'quickPrintForm');
             });
             
             // Advanced tab functionality
@@ -766,29 +2750,152 @@ def create_app():
                     return;
                 }
                 
-                formData.append('file', fileInput.files[0]);
                 formData.append('printer', printerSelect.value);
                 
-                showMessage('Uploading and printing...', 'info');
-                
-                fetch('/upload', {
-                    method: 'POST',
-                    body: formData
+                submitPrintJob('/upload', fileInput.files[0], formData, 'advancedPrintForm');
+            });
+        });
+        
+        function submitPrintJob(url, file, formData, formId) {
+            if (submitting) {
+                showMessage('Another upload is still in progress', 'error');
+                return;
+            }
+            submitting = true;
+            
+            showMessage('Preparing file...', 'info');
+            
+            // Lets the server recognise a resent request as the same job
+            if (!idempotencyKeys[formId]) {
+                idempotencyKeys[formId] = (window.crypto && crypto.randomUUID) ?
+                    crypto.randomUUID() : Date.now() + '-' + Math.random().toString(16).slice(2);
+            }
+            const idempotencyKey = idempotencyKeys[formId];
+            
+            prepareFile(file)
+                .then(prepared => {
+                    formData.append('file', prepared);
+                    if (prepared !== file) {
+                        console.log('Resized ' + file.name + ': ' + file.size + ' -> ' + prepared.size + ' bytes');
+                    }
+                    showMessage('Uploading and printing...', 'info');
+                    return uploadWithProgress(url, formData, idempotencyKey);
                 })
-                .then(response => response.json())
                 .then(data => {
                     if (data.success) {
                         showMessage(data.message, 'success');
-                        document.getElementById('advancedPrintForm').reset();
+                        document.getElementById(formId).reset();
+                        delete idempotencyKeys[formId];
                     } else {
                         showMessage('Print job failed: ' + data.message, 'error');
                     }
                 })
                 .catch(error => {
-                    showMessage('Error: ' + error, 'error');
+                    showMessage(error === 'cancelled' ? 'Upload cancelled' : 'Error: ' + error, 'error');
+                })
+                .finally(() => {
+                    submitting = false;
                 });
+        }
+        
+        function prepareFile(file) {
+            // Downscale large photos to what the printer can actually reproduce
+            if (!document.getElementById('optimizeImages').checked ||
+                    !RESIZABLE_TYPES.includes(file.type) ||
+                    typeof createImageBitmap !== 'function') {
+                return Promise.resolve(file);
+            }
+            
+            return createImageBitmap(file, { imageOrientation: 'from-image' })
+                .then(bitmap => {
+                    const longEdge = Math.round(PAGE_INCHES[1] * CLIENT_IMAGE_DPI);
+                    const shortEdge = Math.round(PAGE_INCHES[0] * CLIENT_IMAGE_DPI);
+                    const scale = Math.min(1,
+                        longEdge / Math.max(bitmap.width, bitmap.height),
+                        shortEdge / Math.min(bitmap.width, bitmap.height));
+                    if (scale >= 1) {
+                        bitmap.close();
+                        return file;
+                    }
+                    
+                    const canvas = document.createElement('canvas');
+                    canvas.width = Math.round(bitmap.width * scale);
+                    canvas.height = Math.round(bitmap.height * scale);
+                    const ctx = canvas.getContext('2d');
+                    // Flatten transparency onto white, as the server would
+                    ctx.fillStyle = '#ffffff';
+                    ctx.fillRect(0, 0, canvas.width, canvas.height);
+                    ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+                    bitmap.close();
+                    
+                    return new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.9))
+                        .then(blob => {
+                            if (!blob || blob.size >= file.size) {
+                                return file;
+                            }
+                            const name = file.name.replace(/\\.[^.]*$/, '') + '.jpg';
+                            return new File([blob], name, { type: 'image/jpeg' });
+                        });
+                })
+                .catch(error => {
+                    // Fall back to the original file if the browser cannot decode it
+                    console.log('Image optimisation skipped: ' + error);
+                    return file;
+                });
+        }
+        
+        function uploadWithProgress(url, formData, idempotencyKey) {
+            return new Promise((resolve, reject) => {
+                const xhr = new XMLHttpRequest();
+                const progress = document.getElementById('uploadProgress');
+                const progressBar = document.getElementById('uploadProgressBar');
+                const progressText = document.getElementById('uploadProgressText');
+                const cancelButton = document.getElementById('cancelUpload');
+                
+                const finish = () => {
+                    currentUpload = null;
+                    progress.style.display = 'none';
+                };
+                
+                xhr.upload.addEventListener('progress', e => {
+                    if (e.lengthComputable) {
+                        const percent = Math.round(e.loaded / e.total * 100);
+                        progressBar.value = percent;
+                        progressText.textContent = percent + '%';
+                    }
+                });
+                xhr.upload.addEventListener('load', () => {
+                    progressText.textContent = 'Printing...';
+                    // The server has the whole file now, so aborting would not stop the print
+                    cancelButton.style.display = 'none';
+                });
+                xhr.addEventListener('load', () => {
+                    finish();
+                    try {
+                        resolve(JSON.parse(xhr.responseText));
+                    } catch (e) {
+                        reject('Unexpected server response (' + xhr.status + ')');
+                    }
+                });
+                xhr.addEventListener('error', () => {
+                    finish();
+                    reject('Network error');
+                });
+                xhr.addEventListener('abort', () => {
+                    finish();
+                    reject('cancelled');
+                });
+                
+                progressBar.value = 0;
+                progressText.textContent = '0%';
+                cancelButton.style.display = '';
+                progress.style.display = 'flex';
+                currentUpload = xhr;
+                xhr.open('POST', url);
+                xhr.setRequestHeader('Idempotency-Key', idempotencyKey);
+                xhr.send(formData);
             });
-        });
+        }
         
         function testDefaultPrinterConnection() {
             const printerName = "RICOH_MP_C3003__002673B8A832_";
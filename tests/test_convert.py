@@ -0,0 +1,113 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from PIL import Image
+from PyPDF2 import PdfReader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import printit
+
+
+class ConvertToPdfTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def profile(self, formats=(), dpi=300, media_default=None):
+        return {'formats': list(formats), 'resolutions': [dpi], 'default_dpi': dpi,
+                'media': [], 'media_default': media_default, 'duplex': False}
+
+    def page_size(self, pdf_path):
+        page = PdfReader(pdf_path).pages[0]
+        return round(float(page.mediabox.width)), round(float(page.mediabox.height))
+
+    def test_small_image_fills_page(self):
+        Image.new('RGB', (800, 600), 'white').save(self.path('small.png'))
+        pdf_path = printit.convert_to_pdf_if_needed(self.path('small.png'), self.profile(dpi=600))
+        # Landscape letter, fitted to the long edge
+        self.assertEqual(self.page_size(pdf_path), (792, 594))
+
+    def test_page_fills_printer_media(self):
+        Image.new('RGB', (1275, 1650), 'white').save(self.path('resized.png'))
+        pdf_path = printit.convert_to_pdf_if_needed(self.path('resized.png'),
+                                                    self.profile(dpi=600, media_default='iso_a4_210x297mm'))
+        self.assertEqual(self.page_size(pdf_path)[0], round(210 / 25.4 * 72))
+
+    def test_page_size_follows_image_dpi(self):
+        Image.new('RGB', (1700, 1100), 'white').save(self.path('scan.png'), dpi=(200, 200))
+        pdf_path = printit.convert_to_pdf_if_needed(self.path('scan.png'), self.profile(dpi=600))
+        self.assertEqual(self.page_size(pdf_path), (612, 396))
+
+    def test_large_non_jpeg_is_downscaled(self):
+        Image.new('RGB', (2550, 3300), 'white').save(self.path('scan.png'))
+        pdf_path = printit.convert_to_pdf_if_needed(self.path('scan.png'), self.profile(dpi=150))
+        page = PdfReader(pdf_path).pages[0]
+        widths = {int(xobject.get_object()['/Width']) for xobject in page['/Resources']['/XObject'].values()}
+        self.assertEqual(widths, {1275})
+        # Downscaling changes the pixel count, not the page
+        self.assertEqual(self.page_size(pdf_path), (612, 792))
+
+    def test_native_single_frame_image_is_not_converted(self):
+        Image.new('RGB', (100, 100), 'white').save(self.path('photo.jpg'))
+        result = printit.convert_to_pdf_if_needed(self.path('photo.jpg'), self.profile(['image/jpeg']))
+        self.assertEqual(result, self.path('photo.jpg'))
+
+    def test_native_multi_frame_image_is_converted(self):
+        frames = [Image.new('RGB', (100, 100), color) for color in ('red', 'green', 'blue')]
+        frames[0].save(self.path('pages.tiff'), save_all=True, append_images=frames[1:])
+        result = printit.convert_to_pdf_if_needed(self.path('pages.tiff'), self.profile(['image/tiff']))
+        self.assertTrue(result.endswith('.pdf'))
+        self.assertEqual(len(PdfReader(result).pages), 3)
+
+    def test_oversized_non_jpeg_is_rejected(self):
+        Image.new('RGB', (200, 200), 'white').save(self.path('poster.png'))
+        limit = printit.CONVERT_MAX_SOURCE_PIXELS
+        printit.CONVERT_MAX_SOURCE_PIXELS = 100 * 100
+        try:
+            with self.assertRaises(Image.DecompressionBombError):
+                printit.open_image(self.path('poster.png'))
+            self.assertEqual(printit.convert_to_pdf_if_needed(self.path('poster.png')), self.path('poster.png'))
+        finally:
+            printit.CONVERT_MAX_SOURCE_PIXELS = limit
+        self.assertFalse(os.path.exists(self.path('poster.pdf')))
+
+    def test_uncompressed_image_is_read_in_bands(self):
+        image = Image.new('RGB', (300, 200), 'white')
+        image.paste(Image.new('RGB', (300, 50), 'red'), (0, 120))
+        image.save(self.path('scan.tiff'))
+        limit = printit.CONVERT_MAX_SOURCE_PIXELS
+        printit.CONVERT_MAX_SOURCE_PIXELS = 100 * 100
+        try:
+            with printit.open_image(self.path('scan.tiff')) as opened:
+                tiles = printit.raw_tiles(opened)
+                self.assertIsNotNone(tiles)
+                band = printit.read_raw_band(opened, tiles, 100, 150)
+                self.assertEqual(band.getpixel((0, 0)), (255, 255, 255))
+                self.assertEqual(band.getpixel((0, 20)), (255, 0, 0))
+            # Above the limit for images decoded whole, but bounded when read in bands
+            self.assertTrue(printit.convert_to_pdf_if_needed(self.path('scan.tiff')).endswith('.pdf'))
+        finally:
+            printit.CONVERT_MAX_SOURCE_PIXELS = limit
+
+    def test_jpeg_limit_is_independent_of_pillow_limit(self):
+        Image.new('RGB', (200, 200), 'white').save(self.path('scan.jpg'))
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = 100 * 100
+        try:
+            with printit.open_image(self.path('scan.jpg')) as image:
+                self.assertEqual(image.size, (200, 200))
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+
+
+if __name__ == '__main__':
+    unittest.main()
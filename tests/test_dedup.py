@@ -0,0 +1,159 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from PyPDF2 import PdfWriter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import printit
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'index.html')
+
+
+def pdf_document(pages=1):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(612, 792)
+    document = io.BytesIO()
+    writer.write(document)
+    return document.getvalue()
+
+
+class DeduplicationTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # create_app rewrites the page template; keep the checked-in copy as it was
+        with open(TEMPLATE_PATH, 'rb') as f:
+            template = f.read()
+        try:
+            cls.client = printit.create_app().test_client()
+        finally:
+            with open(TEMPLATE_PATH, 'wb') as f:
+                f.write(template)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = {name: getattr(printit, name) for name in
+                         ('DEDUP_DB', 'JOBS_DB', 'DEDUP_WINDOW', 'DEDUP_WAIT', 'DEDUP_MAX_ENTRIES',
+                          'test_printer_connection', 'get_printer_profile', 'handle_document')}
+        printit.DEDUP_DB = os.path.join(self.directory, 'dedup.sqlite3')
+        printit.JOBS_DB = os.path.join(self.directory, 'jobs.sqlite3')
+        printit.DEDUP_WINDOW = 0
+        printit.test_printer_connection = lambda printer_info, port=None: (True, 'Connection successful')
+        printit.get_printer_profile = lambda printer_info: None
+        self.printed = []
+        self.results = []
+        printit.handle_document = self.handle_document
+
+    def tearDown(self):
+        for name, value in self.settings.items():
+            setattr(printit, name, value)
+        shutil.rmtree(self.directory)
+
+    def handle_document(self, document_path, printer_name=None, chunk_pages=None, job_id=None, warmup=None):
+        self.printed.append(job_id)
+        return self.results.pop(0) if self.results else (True, 'sent')
+
+    def post(self, content, idempotency_key=None):
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else {}
+        return self.client.post('/print_direct', data={'file': (io.BytesIO(content), 'report.pdf')},
+                                content_type='multipart/form-data', headers=headers)
+
+    def test_idempotency_key_replays_original_result(self):
+        first = self.post(pdf_document(), 'job-1')
+        self.assertTrue(first.json['success'])
+        self.assertIn('job_token', first.json)
+
+        # The same key with a different body is still the same job
+        replay = self.post(pdf_document(2), 'job-1')
+        self.assertEqual(len(self.printed), 1)
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.headers['Idempotent-Replayed'], 'true')
+        self.assertTrue(replay.json['duplicate'])
+        self.assertEqual(replay.json['job_id'], first.json['job_id'])
+        # Only the original submitter may cancel the job
+        self.assertNotIn('job_token', replay.json)
+
+        self.post(pdf_document(), 'job-2')
+        self.assertEqual(len(self.printed), 2)
+
+    def test_repeated_content_is_a_duplicate_only_inside_window(self):
+        document = pdf_document()
+        self.post(document)
+        self.post(document)
+        self.assertEqual(len(self.printed), 2)
+
+        printit.DEDUP_WINDOW = 60
+        first = self.post(document)
+        repeat = self.post(document)
+        self.assertEqual(len(self.printed), 3)
+        self.assertTrue(repeat.json['duplicate'])
+        self.assertEqual(repeat.json['job_id'], first.json['job_id'])
+
+        # Once the window has passed the same file prints again
+        conn = printit.dedup_connection()
+        try:
+            conn.execute("UPDATE submissions SET expires = 0 WHERE key LIKE 'content:%'")
+        finally:
+            conn.close()
+        later = self.post(document)
+        self.assertEqual(len(self.printed), 4)
+        self.assertNotIn('duplicate', later.json)
+
+    def test_failed_job_releases_its_claim(self):
+        printit.DEDUP_WINDOW = 60
+        document = pdf_document()
+        self.results = [(False, 'Printer is offline')]
+        failed = self.post(document, 'job-1')
+        self.assertFalse(failed.json['success'])
+
+        retry = self.post(document, 'job-1')
+        self.assertEqual(len(self.printed), 2)
+        self.assertTrue(retry.json['success'])
+        self.assertNotIn('duplicate', retry.json)
+
+    def test_pending_claim_times_out_with_retry_after(self):
+        printit.DEDUP_WAIT = 0.5
+        self.assertIsNone(printit.claim_submission('key:job-1', printit.IDEMPOTENCY_TTL))
+        response = self.post(pdf_document(), 'job-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.headers['Retry-After'], str(printit.DEDUP_RETRY_AFTER))
+        self.assertEqual(self.printed, [])
+
+    def test_duplicate_waits_for_original_result(self):
+        self.assertIsNone(printit.claim_submission('key:job-1', printit.IDEMPOTENCY_TTL))
+        original = {'success': True, 'message': 'sent', 'job_id': 'abc'}
+        finisher = threading.Timer(0.2, printit.complete_submission, ('key:job-1', original))
+        finisher.start()
+        result, duplicate = printit.run_deduplicated([('key:job-1', printit.IDEMPOTENCY_TTL)], self.fail)
+        finisher.join()
+        self.assertTrue(duplicate)
+        self.assertEqual(result, original)
+
+    def test_oldest_entries_are_evicted(self):
+        printit.DEDUP_MAX_ENTRIES = 3
+        for index in range(5):
+            printit.run_deduplicated([(f'key:job-{index}', printit.IDEMPOTENCY_TTL)],
+                                     lambda: {'success': True, 'message': 'sent'})
+        conn = printit.dedup_connection()
+        try:
+            keys = [row[0] for row in conn.execute('SELECT key FROM submissions ORDER BY created')]
+        finally:
+            conn.close()
+        self.assertEqual(keys, ['key:job-2', 'key:job-3', 'key:job-4'])
+
+        # An evicted key is treated as new
+        _, duplicate = printit.run_deduplicated([('key:job-0', printit.IDEMPOTENCY_TTL)],
+                                                lambda: {'success': True, 'message': 'sent'})
+        self.assertFalse(duplicate)
+        _, duplicate = printit.run_deduplicated([('key:job-4', printit.IDEMPOTENCY_TTL)], self.fail)
+        self.assertTrue(duplicate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import http.server
+import os
+import struct
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import printit
+
+
+def ipp_response(status, groups):
+    """Encode an IPP response from (group tag, [(value tag, name, raw value)]) pairs"""
+    body = struct.pack('>BBHI', 1, 1, status, 1)
+    for group_tag, attributes in groups:
+        body += bytes([group_tag])
+        for tag, name, value in attributes:
+            body += printit.ipp_attribute(tag, name, value)
+    return body + bytes([printit.IPP_END_OF_ATTRIBUTES_TAG])
+
+
+def resolution(x, y, units=3):
+    return struct.pack('>iib', x, y, units)
+
+
+PRINTER_ATTRIBUTES = [
+    (printit.IPP_OPERATION_ATTRIBUTES_TAG, [
+        (printit.IPP_CHARSET, 'attributes-charset', 'utf-8'),
+    ]),
+    (0x04, [
+        (0x49, 'document-format-supported', 'application/pdf'),
+        (0x49, '', 'image/jpeg'),
+        (printit.IPP_RESOLUTION, 'printer-resolution-supported', resolution(300, 300)),
+        (printit.IPP_RESOLUTION, '', resolution(236, 236, printit.IPP_DOTS_PER_CM)),
+        (printit.IPP_RESOLUTION, 'printer-resolution-default', resolution(600, 600)),
+        (printit.IPP_KEYWORD, 'urf-supported', 'W8'),
+        (printit.IPP_KEYWORD, '', 'RS300-1200'),
+        (printit.IPP_KEYWORD, 'media-supported', 'na_letter_8.5x11in'),
+        (printit.IPP_KEYWORD, '', 'iso_a4_210x297mm'),
+        (printit.IPP_KEYWORD, 'media-default', 'na_letter_8.5x11in'),
+        (printit.IPP_KEYWORD, 'sides-supported', 'one-sided'),
+        (printit.IPP_KEYWORD, '', 'two-sided-long-edge'),
+    ]),
+]
+
+
+class StubIppHandler(http.server.BaseHTTPRequestHandler):
+    """Answers every Get-Printer-Attributes request with PRINTER_ATTRIBUTES"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, body))
+        if self.server.fail:
+            self.send_response(500)
+            self.end_headers()
+            return
+        response = ipp_response(0x0000, PRINTER_ATTRIBUTES)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/ipp')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class IppEncodingTests(unittest.TestCase):
+    def test_request_layout(self):
+        body = printit.build_ipp_request(printit.IPP_GET_PRINTER_ATTRIBUTES, 'ipp://host:631/ipp/print',
+                                         ['printer-name', 'media-default'], request_id=7)
+        self.assertEqual(body[:8], struct.pack('>BBHI', 1, 1, 0x000B, 7))
+        self.assertEqual(body[8], printit.IPP_OPERATION_ATTRIBUTES_TAG)
+        self.assertEqual(body[-1], printit.IPP_END_OF_ATTRIBUTES_TAG)
+        # Additional values of requested-attributes are encoded with an empty name
+        self.assertIn(printit.ipp_attribute(printit.IPP_KEYWORD, '', 'media-default'), body)
+
+    def test_request_round_trip(self):
+        body = printit.build_ipp_request(printit.IPP_GET_JOBS, 'ipp://host:631/printers/office',
+                                         ['job-id', 'job-state'],
+                                         [(printit.IPP_INTEGER, 'limit', struct.pack('>i', 5))])
+        # Request and response headers share a layout, so the decoder reads the operation as the status
+        operation, attributes = printit.parse_ipp_response(body)
+        self.assertEqual(operation, printit.IPP_GET_JOBS)
+        self.assertEqual(attributes['printer-uri'], ['ipp://host:631/printers/office'])
+        self.assertEqual(attributes['limit'], [5])
+        self.assertEqual(attributes['requested-attributes'], ['job-id', 'job-state'])
+
+    def test_decode_values(self):
+        data = ipp_response(0x0001, [(printit.IPP_JOB_ATTRIBUTES_TAG, [
+            (printit.IPP_INTEGER, 'job-id', struct.pack('>i', 42)),
+            (printit.IPP_ENUM, 'job-state', struct.pack('>i', 9)),
+            (printit.IPP_BOOLEAN, 'color-supported', b'\1'),
+            (printit.IPP_RANGE_OF_INTEGER, 'copies-supported', struct.pack('>ii', 1, 99)),
+            (printit.IPP_RESOLUTION, 'printer-resolution-default', resolution(600, 300)),
+            (0x30, 'printer-icc-profiles', b'\x00\x01'),
+        ])])
+        status, attributes = printit.parse_ipp_response(data)
+        self.assertEqual(status, 0x0001)
+        self.assertEqual(attributes['job-id'], [42])
+        self.assertEqual(attributes['job-state'], [9])
+        self.assertEqual(attributes['color-supported'], [True])
+        self.assertEqual(attributes['copies-supported'], [(1, 99)])
+        self.assertEqual(attributes['printer-resolution-default'], [(600, 300, 3)])
+        self.assertEqual(attributes['printer-icc-profiles'], [b'\x00\x01'])
+
+    def test_decode_by_group(self):
+        data = ipp_response(0x0000, [
+            (printit.IPP_OPERATION_ATTRIBUTES_TAG, [(printit.IPP_CHARSET, 'attributes-charset', 'utf-8')]),
+            (printit.IPP_JOB_ATTRIBUTES_TAG, [(printit.IPP_INTEGER, 'job-id', struct.pack('>i', 1))]),
+            (printit.IPP_JOB_ATTRIBUTES_TAG, [(printit.IPP_INTEGER, 'job-id', struct.pack('>i', 2))]),
+        ])
+        _, groups = printit.parse_ipp_response(data, by_group=True)
+        jobs = [attributes['job-id'] for tag, attributes in groups if tag == printit.IPP_JOB_ATTRIBUTES_TAG]
+        self.assertEqual(jobs, [[1], [2]])
+
+    def test_resolution_dpi(self):
+        self.assertEqual(printit.resolution_dpi((600, 300, 3)), 300)
+        self.assertEqual(printit.resolution_dpi((118, 118, printit.IPP_DOTS_PER_CM)), 300)
+
+
+class PrinterProfileTests(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), StubIppHandler)
+        self.server.requests = []
+        self.server.fail = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.printer = {'name': 'stub', 'ip': '127.0.0.1', 'port': self.server.server_port,
+                        'ipp_path': '/ipp/print'}
+        printit.PRINTER_PROFILES.clear()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        printit.PRINTER_PROFILES.clear()
+
+    def test_fetch_profile(self):
+        profile = printit.fetch_printer_profile(self.printer)
+        path, body = self.server.requests[0]
+        self.assertEqual(path, '/ipp/print')
+        self.assertEqual(struct.unpack_from('>H', body, 2)[0], printit.IPP_GET_PRINTER_ATTRIBUTES)
+        self.assertEqual(profile['formats'], ['application/pdf', 'image/jpeg'])
+        self.assertEqual(profile['resolutions'], [300, 599, 1200])
+        self.assertEqual(profile['default_dpi'], 600)
+        self.assertEqual(profile['media'], ['na_letter_8.5x11in', 'iso_a4_210x297mm'])
+        self.assertEqual(profile['media_default'], 'na_letter_8.5x11in')
+        self.assertTrue(profile['duplex'])
+
+    def test_profile_is_cached(self):
+        first = printit.get_printer_profile(self.printer)
+        second = printit.get_printer_profile(self.printer)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_failed_fetch_is_cached_as_unavailable(self):
+        self.server.fail = True
+        self.assertIsNone(printit.get_printer_profile(self.printer))
+        self.assertIsNone(printit.get_printer_profile(self.printer))
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
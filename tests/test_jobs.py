@@ -0,0 +1,159 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import printit
+
+PRINTER = printit.STATIC_PRINTER['name']
+
+
+class JobStateTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = {name: getattr(printit, name) for name in
+                         ('JOBS_DB', 'query_printer_job_states', 'job_tracker_pid')}
+        printit.JOBS_DB = os.path.join(self.directory, 'jobs.sqlite3')
+        # Keep the background tracker from starting; the tests poll themselves
+        printit.job_tracker_pid = os.getpid()
+        self.printer_states = {}
+        self.queries = []
+        printit.query_printer_job_states = self.query_printer_job_states
+
+    def tearDown(self):
+        for name, value in self.settings.items():
+            setattr(printit, name, value)
+        shutil.rmtree(self.directory)
+
+    def query_printer_job_states(self, printer_info, cups_job_ids):
+        self.queries.append(sorted(cups_job_ids))
+        return {job_id: self.printer_states.get(job_id, 'pending') for job_id in cups_job_ids}
+
+    def submit_part(self, job_id, cups_job_id):
+        """Register a CUPS job for job_id the way a successful lp submission does"""
+        token = printit.current_job_id.set(job_id)
+        try:
+            printit.record_lp_request_id(f"request id is {PRINTER}-{cups_job_id} (1 file(s))",
+                                         printit.STATIC_PRINTER)
+        finally:
+            printit.current_job_id.reset(token)
+
+    def cups_states(self, job_id):
+        return {part['id']: part['state'] for part in printit.get_job(job_id)['cups_jobs']}
+
+    def test_early_chunks_finish_while_later_ones_are_submitted(self):
+        job_id = printit.create_job(PRINTER, 'report.pdf')
+        self.submit_part(job_id, 101)
+        self.printer_states[101] = 'completed'
+        printit.poll_outstanding_jobs()
+        # The first chunk has finished, but the job is still being submitted
+        self.assertEqual(self.cups_states(job_id), {101: 'completed'})
+        self.assertEqual(printit.get_job(job_id)['state'], 'received')
+
+        self.submit_part(job_id, 102)
+        printit.finish_job_submission(job_id, True, 'Document sent in 2 chunks')
+        job = printit.get_job(job_id)
+        self.assertEqual(job['state'], 'submitted')
+        self.assertIsNone(job['finished'])
+
+        self.printer_states[102] = 'processing'
+        printit.poll_outstanding_jobs()
+        self.assertEqual(printit.get_job(job_id)['state'], 'processing')
+        # Only the unfinished part is asked about
+        self.assertEqual(self.queries[-1], [102])
+
+        self.printer_states[102] = 'completed'
+        self.assertEqual(printit.poll_outstanding_jobs(), (1, 1))
+        job = printit.get_job(job_id)
+        self.assertEqual(job['state'], 'completed')
+        self.assertIsNotNone(job['latency'])
+
+    def test_all_chunks_finished_before_submission_ends(self):
+        job_id = printit.create_job(PRINTER, 'report.pdf')
+        for cups_job_id in (201, 202):
+            self.submit_part(job_id, cups_job_id)
+            self.printer_states[cups_job_id] = 'completed'
+        printit.poll_outstanding_jobs()
+        printit.finish_job_submission(job_id, True, 'Document sent in 2 chunks')
+        self.assertEqual(printit.get_job(job_id)['state'], 'completed')
+
+    def test_mixed_terminal_states(self):
+        cases = [(('completed', 'aborted', 'canceled'), 'aborted'),
+                 (('completed', 'canceled'), 'canceled'),
+                 (('completed', 'completed'), 'completed')]
+        cups_job_id = 300
+        for part_states, expected in cases:
+            job_id = printit.create_job(PRINTER, 'report.pdf')
+            for state in part_states:
+                cups_job_id += 1
+                self.submit_part(job_id, cups_job_id)
+                self.printer_states[cups_job_id] = state
+            printit.finish_job_submission(job_id, True, 'sent')
+            printit.poll_outstanding_jobs()
+            with self.subTest(part_states=part_states):
+                self.assertEqual(printit.get_job(job_id)['state'], expected)
+
+    def test_unfinished_part_keeps_job_active(self):
+        job_id = printit.create_job(PRINTER, 'report.pdf')
+        for cups_job_id, state in ((401, 'aborted'), (402, 'held')):
+            self.submit_part(job_id, cups_job_id)
+            self.printer_states[cups_job_id] = state
+        printit.finish_job_submission(job_id, True, 'sent')
+        printit.poll_outstanding_jobs()
+        job = printit.get_job(job_id)
+        self.assertEqual(job['state'], 'held')
+        self.assertIsNone(job['finished'])
+
+    def test_untracked_submission_is_sent(self):
+        job_id = printit.create_job(PRINTER, 'report.pdf')
+        printit.finish_job_submission(job_id, True, 'Sent over raw socket')
+        job = printit.get_job(job_id)
+        self.assertEqual((job['state'], job['message']), ('sent', 'Sent over raw socket'))
+        # Nothing to follow, so polling leaves it alone
+        self.assertEqual(printit.poll_outstanding_jobs(), (0, 0))
+        self.assertEqual(self.queries, [])
+        self.assertEqual(printit.get_job(job_id)['state'], 'sent')
+
+    def test_failed_submission_is_not_followed(self):
+        job_id = printit.create_job(PRINTER, 'report.pdf')
+        self.submit_part(job_id, 501)
+        printit.finish_job_submission(job_id, False, 'Chunk 2/2 failed')
+        self.printer_states[501] = 'completed'
+        printit.poll_outstanding_jobs()
+        job = printit.get_job(job_id)
+        self.assertEqual((job['state'], job['message']), ('failed', 'Chunk 2/2 failed'))
+        self.assertIsNone(job['finished'])
+
+    def test_job_never_reported_finished_becomes_unknown(self):
+        job_id = printit.create_job(PRINTER, 'report.pdf')
+        self.submit_part(job_id, 601)
+        printit.finish_job_submission(job_id, True, 'sent')
+        self.printer_states[601] = 'processing'
+        printit.poll_outstanding_jobs()
+        self.assertEqual(printit.get_job(job_id)['state'], 'processing')
+
+        conn = printit.jobs_connection()
+        try:
+            conn.execute('UPDATE jobs SET submitted = ? WHERE id = ?',
+                         (time.time() - printit.JOB_TRACK_TIMEOUT - 1, job_id))
+        finally:
+            conn.close()
+        printit.poll_outstanding_jobs()
+        job = printit.get_job(job_id)
+        self.assertEqual((job['state'], job['message']), ('unknown', 'Printer never reported completion'))
+        self.assertEqual(self.cups_states(job_id), {601: 'unknown'})
+
+        # Unknown jobs are no longer polled, even if the printer catches up
+        self.printer_states[601] = 'completed'
+        queries = len(self.queries)
+        self.assertEqual(printit.poll_outstanding_jobs(), (0, 0))
+        self.assertEqual(len(self.queries), queries)
+        self.assertEqual(printit.get_job(job_id)['state'], 'unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
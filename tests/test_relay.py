@@ -0,0 +1,195 @@
+import http.client
+import http.server
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+RELAY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api', 'index.py')
+spec = importlib.util.spec_from_file_location('relay', RELAY_PATH)
+relay = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(relay)
+
+BOUNDARY = 'relaytestboundary'
+
+
+def multipart(content, filename='report.pdf'):
+    return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n").encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+class StandInSpoolHandler(http.server.BaseHTTPRequestHandler):
+    """Records each forwarded upload and answers with the next scripted status (200 once they run out)"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((self.path, dict(self.headers), body))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        reply = json.dumps({'success': status == 200, 'message': f"spool {status}"}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+class QuietRelayHandler(relay.Handler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class RelayTests(unittest.TestCase):
+    def setUp(self):
+        self.settings = {name: getattr(relay, name) for name in
+                         ('SPOOL_URL', 'BUFFER_DIR', 'RELAY_MAX_BYTES', 'RELAY_RETRY_DELAY',
+                          'RELAY_TIME_BUDGET', 'RELAY_BUFFER_RESERVE', 'RELAY_DRAIN_MIN_TIME')}
+        relay.BUFFER_DIR = tempfile.mkdtemp()
+        relay.RELAY_RETRY_DELAY = 0.01
+        self.spool = start_server(http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInSpoolHandler))
+        self.spool.received = []
+        self.spool.statuses = []
+        relay.SPOOL_URL = f"http://127.0.0.1:{self.spool.server_port}"
+        self.relay = start_server(http.server.ThreadingHTTPServer(('127.0.0.1', 0), QuietRelayHandler))
+
+    def tearDown(self):
+        for server in (self.relay, self.spool):
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(relay.BUFFER_DIR)
+        for name, value in self.settings.items():
+            setattr(relay, name, value)
+
+    def post(self, body, path='/print_direct', headers=None, content_length=True):
+        conn = http.client.HTTPConnection('127.0.0.1', self.relay.server_port, timeout=30)
+        try:
+            conn.putrequest('POST', path)
+            conn.putheader('Content-Type', f"multipart/form-data; boundary={BOUNDARY}")
+            if content_length:
+                conn.putheader('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                conn.putheader(name, value)
+            conn.endheaders()
+            conn.send(body)
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            conn.close()
+
+    def buffered(self):
+        return sorted(os.listdir(relay.BUFFER_DIR))
+
+    def test_forwards_upload_with_idempotency_key(self):
+        body = multipart(os.urandom(300 * 1024))
+        status, reply = self.post(body, headers={'Idempotency-Key': 'job-1'})
+        self.assertEqual((status, reply['message']), (200, 'spool 200'))
+        path, headers, forwarded = self.spool.received[0]
+        self.assertEqual(path, '/print_direct')
+        self.assertEqual(forwarded, body)
+        self.assertEqual(headers['Idempotency-Key'], 'job-1')
+        self.assertEqual(headers['Content-Type'], f"multipart/form-data; boundary={BOUNDARY}")
+
+    def test_generates_idempotency_key(self):
+        self.post(multipart(b'%PDF-1.4'), path='/upload')
+        path, headers, _ = self.spool.received[0]
+        self.assertEqual(path, '/upload')
+        self.assertTrue(headers['Idempotency-Key'])
+
+    def test_retries_server_errors_with_the_same_key(self):
+        self.spool.statuses = [503, 502]
+        status, _ = self.post(multipart(b'%PDF-1.4'))
+        self.assertEqual(status, 200)
+        keys = [headers['Idempotency-Key'] for _, headers, _ in self.spool.received]
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(len(set(keys)), 1)
+
+    def test_client_errors_are_not_retried(self):
+        self.spool.statuses = [400]
+        status, _ = self.post(multipart(b'%PDF-1.4'))
+        self.assertEqual(status, 400)
+        self.assertEqual(len(self.spool.received), 1)
+
+    def test_unreachable_spool_server_buffers_until_next_success(self):
+        with socket.socket() as unused:
+            unused.bind(('127.0.0.1', 0))
+            closed_port = unused.getsockname()[1]
+        relay.SPOOL_URL = f"http://127.0.0.1:{closed_port}"
+        queued_body = multipart(b'%PDF-1.4 queued')
+        status, reply = self.post(queued_body, headers={'Idempotency-Key': 'queued'})
+        self.assertEqual(status, 202)
+        self.assertTrue(reply['queued'])
+        self.assertEqual(len(self.buffered()), 2)
+
+        relay.SPOOL_URL = f"http://127.0.0.1:{self.spool.server_port}"
+        status, _ = self.post(multipart(b'%PDF-1.4 next'), headers={'Idempotency-Key': 'next'})
+        self.assertEqual(status, 200)
+        # The reply is sent before the buffer is drained
+        for _ in range(100):
+            if len(self.spool.received) == 2 and not self.buffered():
+                break
+            time.sleep(0.05)
+        self.assertEqual([headers['Idempotency-Key'] for _, headers, _ in self.spool.received], ['next', 'queued'])
+        self.assertEqual(self.spool.received[1][2], queued_body)
+        self.assertEqual(self.buffered(), [])
+
+    def test_rejects_oversized_upload(self):
+        relay.RELAY_MAX_BYTES = 1024
+        status, _ = self.post(multipart(os.urandom(2048)))
+        self.assertEqual(status, 413)
+        self.assertEqual(self.spool.received, [])
+
+    def test_requires_content_length(self):
+        status, _ = self.post(b'', content_length=False)
+        self.assertEqual(status, 411)
+
+    def test_rejects_malformed_multipart(self):
+        status, reply = self.post(b'--someotherboundary\r\n\r\nnot the declared boundary')
+        self.assertEqual(status, 400)
+        self.assertEqual(reply['message'], 'Malformed multipart body')
+        self.assertEqual(self.spool.received, [])
+
+    def test_silent_spool_server_is_bounded_by_time_budget(self):
+        # Accepts connections and reads requests but never answers
+        listener = socket.create_server(('127.0.0.1', 0))
+        connections = []
+
+        def accept():
+            while True:
+                try:
+                    conn, _ = listener.accept()
+                except OSError:
+                    return
+                connections.append(conn)
+
+        threading.Thread(target=accept, daemon=True).start()
+        relay.SPOOL_URL = f"http://127.0.0.1:{listener.getsockname()[1]}"
+        relay.RELAY_TIME_BUDGET = 3
+        relay.RELAY_BUFFER_RESERVE = 1
+        try:
+            started = time.monotonic()
+            status, reply = self.post(multipart(b'%PDF-1.4'))
+            elapsed = time.monotonic() - started
+        finally:
+            listener.close()
+            for conn in connections:
+                conn.close()
+        self.assertEqual(status, 202)
+        self.assertTrue(reply['queued'])
+        self.assertLess(elapsed, relay.RELAY_TIME_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
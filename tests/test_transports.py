@@ -0,0 +1,166 @@
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import printit
+
+
+class StandInPrinter:
+    """A one-connection TCP server on localhost that runs handler(conn) in a thread"""
+
+    def __init__(self, handler):
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        self.handler = handler
+        self.error = None
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        try:
+            conn, _ = self.listener.accept()
+            with conn:
+                conn.settimeout(5)
+                self.handler(conn)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.listener.close()
+
+    def join(self):
+        self.thread.join(5)
+        if self.error:
+            raise self.error
+
+
+def read_line(conn):
+    line = b''
+    while not line.endswith(b'\n'):
+        byte = conn.recv(1)
+        if not byte:
+            raise ConnectionError(f"Connection closed after {line!r}")
+        line += byte
+    return line
+
+
+def read_exactly(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(min(65536, size - len(data)))
+        if not chunk:
+            raise ConnectionError(f"Connection closed after {len(data)} of {size} bytes")
+        data += chunk
+    return data
+
+
+class TransportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.document = os.path.join(self.directory, 'report.pdf')
+        self.payload = b'%PDF-1.4\n' + os.urandom(256 * 1024)
+        with open(self.document, 'wb') as f:
+            f.write(self.payload)
+        printit.PRINTER_REACHABILITY.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        printit.PRINTER_REACHABILITY.clear()
+
+    def printer(self, **settings):
+        return dict({'name': 'stand-in', 'ip': '127.0.0.1', 'port': 631}, **settings)
+
+
+class RawSocketTests(TransportTestCase):
+    def test_sends_whole_document(self):
+        received = []
+
+        def handler(conn):
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                received.append(chunk)
+
+        server = StandInPrinter(handler)
+        success, message = printit.print_raw_socket(self.printer(raw_port=server.port), self.document)
+        server.join()
+        self.assertTrue(success, message)
+        self.assertEqual(b''.join(received), self.payload)
+
+    def test_unreachable_printer_fails_fast(self):
+        listener = socket.create_server(('127.0.0.1', 0))
+        port = listener.getsockname()[1]
+        listener.close()
+        success, _ = printit.print_raw_socket(self.printer(raw_port=port), self.document)
+        self.assertFalse(success)
+        # The failed connection is remembered, so the next attempt does not wait for a timeout
+        self.assertTrue(printit.recently_unreachable('127.0.0.1', port))
+
+
+class LpdTests(TransportTestCase):
+    def test_rfc1179_exchange(self):
+        exchange = {}
+
+        def handler(conn):
+            # 02 Receive a printer job
+            exchange['receive'] = read_line(conn)
+            conn.sendall(b'\0')
+            # 02 Receive control file subcommand, then the file and a terminating zero byte
+            exchange['control_command'] = read_line(conn)
+            conn.sendall(b'\0')
+            size = int(exchange['control_command'][1:].split(b' ')[0])
+            exchange['control'] = read_exactly(conn, size + 1)
+            conn.sendall(b'\0')
+            # 03 Receive data file subcommand, then the file and a terminating zero byte
+            exchange['data_command'] = read_line(conn)
+            conn.sendall(b'\0')
+            size = int(exchange['data_command'][1:].split(b' ')[0])
+            exchange['data'] = read_exactly(conn, size + 1)
+            conn.sendall(b'\0')
+
+        server = StandInPrinter(handler)
+        success, message = printit.print_lpd(self.printer(lpd_port=server.port, lpd_queue='office'),
+                                             self.document)
+        server.join()
+        self.assertTrue(success, message)
+        self.assertEqual(exchange['receive'], b'\x02office\n')
+
+        size, control_name = exchange['control_command'][1:-1].decode().split(' ')
+        self.assertEqual(exchange['control_command'][:1], b'\x02')
+        self.assertTrue(control_name.startswith('cfA'))
+        self.assertEqual(exchange['control'][-1:], b'\0')
+        control = exchange['control'][:-1].decode()
+        self.assertEqual(len(control), int(size))
+
+        size, data_name = exchange['data_command'][1:-1].decode().split(' ')
+        self.assertEqual(exchange['data_command'][:1], b'\x03')
+        self.assertEqual(int(size), len(self.payload))
+        self.assertEqual(data_name, 'd' + control_name[1:])
+        self.assertEqual(exchange['data'], self.payload + b'\0')
+
+        lines = control.splitlines()
+        self.assertIn(f"l{data_name}", lines)
+        self.assertIn('Nreport.pdf', lines)
+        self.assertTrue(any(line.startswith('H') for line in lines))
+        self.assertTrue(any(line.startswith('P') for line in lines))
+
+    def test_refused_queue(self):
+        def handler(conn):
+            read_line(conn)
+            conn.sendall(b'\1')
+
+        server = StandInPrinter(handler)
+        success, message = printit.print_lpd(self.printer(lpd_port=server.port), self.document)
+        server.join()
+        self.assertFalse(success)
+        self.assertIn('refused', message)
+
+
+if __name__ == '__main__':
+    unittest.main()
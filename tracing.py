@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Lightweight per-job tracing for printit
+
+Every request or print job gets a correlation (trace) ID, and timed stages are
+recorded as nested spans. Spans are buffered and appended in batches to a JSONL
+file, one span per line.
+
+Run this file to summarise a trace file:
+    python tracing.py [printit_trace.jsonl] [--top 10]
+"""
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+TRACE_FILE = 'printit_trace.jsonl'
+TRACE_BATCH_SIZE = 100
+TRACE_FLUSH_INTERVAL = 2.0  # seconds
+
+# (trace_id, span_id) of the span currently open in this thread/context
+current_context = contextvars.ContextVar('trace_context', default=(None, None))
+TRACE_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+pending = []
+pending_lock = threading.Lock()
+flusher_pid = None
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+def current_trace_id():
+    return current_context.get()[0]
+
+def valid_trace_id(value):
+    """Return value if it is safe to use as a trace ID (e.g. from a request header), else None"""
+    if value and TRACE_ID_PATTERN.match(value):
+        return value
+    return None
+
+def start_span(name, trace_id=None, **attrs):
+    """Open a span and make it current; pass the returned handle to end_span"""
+    parent_trace, parent_id = current_context.get()
+    trace_id = trace_id or parent_trace or new_trace_id()
+    span = {
+        'trace': trace_id,
+        'span': uuid.uuid4().hex[:16],
+        'parent': parent_id if trace_id == parent_trace else None,
+        'name': name,
+        'ts': round(time.time(), 6),
+        'pid': os.getpid()
+    }
+    if attrs:
+        span['attrs'] = attrs
+    token = current_context.set((trace_id, span['span']))
+    return span, token, time.monotonic()
+
+def end_span(handle, error=None):
+    """Close a span opened with start_span and queue it for writing"""
+    span, token, started = handle
+    span['ms'] = round((time.monotonic() - started) * 1000, 3)
+    if error is not None:
+        span['error'] = str(error) or type(error).__name__
+    try:
+        current_context.reset(token)
+    except ValueError:
+        # Closed from a different context than it was opened in
+        current_context.set((None, None))
+    record(span)
+
+@contextmanager
+def span(name, trace_id=None, **attrs):
+    """Time the enclosed block as a span; yields the span dict so callers can add attrs"""
+    handle = start_span(name, trace_id, **attrs)
+    error = None
+    try:
+        yield handle[0]
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        end_span(handle, error)
+
+def traced(name):
+    """Decorator that records each call of a function as a span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record(span):
+    """Buffer a finished span, flushing when the batch is full"""
+    global flusher_pid
+    with pending_lock:
+        if flusher_pid != os.getpid():
+            # First span in this process (or in a freshly forked worker)
+            flusher_pid = os.getpid()
+            pending.clear()
+            threading.Thread(target=flush_periodically, name='trace-flusher', daemon=True).start()
+        pending.append(span)
+        full = len(pending) >= TRACE_BATCH_SIZE
+    if full:
+        flush()
+
+def flush():
+    """Append all buffered spans to TRACE_FILE in a single write"""
+    with pending_lock:
+        if not pending:
+            return
+        batch = ''.join(json.dumps(s, separators=(',', ':')) + '\n' for s in pending)
+        pending.clear()
+    try:
+        with open(TRACE_FILE, 'a') as f:
+            f.write(batch)
+    except OSError as e:
+        logging.getLogger(__name__).warning(f"Could not write trace file {TRACE_FILE}: {e}")
+
+def flush_periodically():
+    while True:
+        time.sleep(TRACE_FLUSH_INTERVAL)
+        flush()
+
+atexit.register(flush)
+
+class TraceIdFilter(logging.Filter):
+    """Add the current trace ID to log records as %(trace_id)s"""
+    def filter(self, record):
+        record.trace_id = current_trace_id() or '-'
+        return True
+
+def load_spans(path):
+    spans = []
+    with open(path) as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                pass  # partially written line
+    return spans
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def summarise(spans, top=10):
+    """Print the slowest traces and a per-stage timing breakdown"""
+    roots = [s for s in spans if s.get('parent') is None]
+    by_trace = {}
+    for s in spans:
+        by_trace.setdefault(s['trace'], []).append(s)
+
+    print(f"{len(roots)} traces, {len(spans)} spans\n")
+    print(f"Slowest {min(top, len(roots))} traces:")
+    for root in sorted(roots, key=lambda s: s['ms'], reverse=True)[:top]:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(root['ts']))
+        error = f"  ERROR: {root['error']}" if 'error' in root else ''
+        print(f"  {root['ms']:10.1f} ms  {root['trace']}  {when}  {root['name']}{error}")
+        stages = {}
+        for s in by_trace[root['trace']]:
+            if s is not root:
+                stages[s['name']] = stages.get(s['name'], 0) + s['ms']
+        for name, ms in sorted(stages.items(), key=lambda item: item[1], reverse=True):
+            print(f"  {'':10}     {ms:10.1f} ms  {name}")
+
+    print("\nStage breakdown:")
+    print(f"  {'stage':<28}{'count':>7}{'mean ms':>11}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}{'errors':>8}")
+    stages = {}
+    for s in spans:
+        stages.setdefault(s['name'], []).append(s)
+    for name, group in sorted(stages.items(), key=lambda item: sum(s['ms'] for s in item[1]), reverse=True):
+        durations = [s['ms'] for s in group]
+        errors = sum(1 for s in group if 'error' in s)
+        print(f"  {name[:27]:<28}{len(group):>7}{sum(durations) / len(group):>11.1f}"
+              f"{percentile(durations, 0.5):>11.1f}{percentile(durations, 0.95):>11.1f}"
+              f"{max(durations):>11.1f}{errors:>8}")
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Summarise a printit trace file')
+    parser.add_argument('trace_file', nargs='?', default=TRACE_FILE, help='JSONL trace file')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest traces to show')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.trace_file):
+        print(f"Trace file not found: {args.trace_file}")
+        sys.exit(1)
+    summarise(load_spans(args.trace_file), args.top)
+
+if __name__ == "__main__":
+    main()